@@ -0,0 +1,164 @@
+# acquisition.py
+import functools
+import threading
+import time
+
+# ========== Adquisición continua ==========
+# Bucle bomba -> espera de asentamiento -> captura, repetido `frames` veces.
+# Cada frame se envía al pool de trabajos sin esperar su resultado, así que el
+# movimiento de la bomba del frame k+1 se solapa con la segmentación y
+# clasificación del frame k. Si la cola está llena, el bucle espera (la
+# contrapresión frena la adquisición en lugar de descartar frames).
+# Con `make_tracker(run_id, steps)` cada resultado se pasa además al
+# seguimiento (tracking.py) con su índice de frame, y cuando ya no quedan
+# trabajos pendientes de la tanda se cierra con el volumen bombeado.
+class Acquisition:
+    def __init__(self, pump, capture, submit, log, make_tracker=None, ml_per_step=None):
+        self.pump = pump
+        self.capture = capture
+        self.submit = submit
+        self.log = log
+        self.make_tracker = make_tracker
+        self.ml_per_step = ml_per_step or (lambda: 0.0)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.tracker = None
+        self.state = self._empty_state("idle")
+
+    def _empty_state(self, status):
+        return {
+            "status": status,
+            "run": None,
+            "frames_total": 0,
+            "frames_captured": 0,
+            "frames_processed": 0,
+            "frames_failed": 0,
+            "steps": 0,
+            "settle": 0.0,
+            "started": None,
+            "finished": None,
+            "class_count": {},
+            "error": None
+        }
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, run_id, frames, steps, settle):
+        with self.lock:
+            if self.running():
+                return False
+            self.stop_event.clear()
+            self.tracker = self.make_tracker(run_id, steps) if self.make_tracker else None
+            self.state = self._empty_state("running")
+            self.state.update({
+                "run": run_id,
+                "frames_total": frames,
+                "steps": steps,
+                "settle": settle,
+                "started": time.time()
+            })
+            self.thread = threading.Thread(target=self._run, args=(run_id, frames, steps, settle), name="acquisition", daemon=True)
+            self.thread.start()
+        return True
+
+    def stop(self):
+        if not self.running():
+            return False
+        with self.lock:
+            self.state["status"] = "stopping"
+        self.stop_event.set()
+        return True
+
+    def _run(self, run_id, frames, steps, settle):
+        self.log(f"Acquisition {run_id} started: {frames} frames, {steps} steps, {settle}s settle")
+        try:
+            for index in range(frames):
+                if self.stop_event.is_set():
+                    break
+                self.pump(steps)
+                if self.stop_event.wait(settle):
+                    break
+                frame = self.capture(run_id, index)
+                with self.lock:
+                    self.state["frames_captured"] += 1
+                submitted = False
+                while not submitted and not self.stop_event.is_set():
+                    submitted = self.submit(frame, functools.partial(self._on_processed, run_id, index))
+                if not submitted:
+                    with self.lock:
+                        self.state["frames_failed"] += 1
+                    if self.tracker is not None:
+                        self.tracker.frame(index, None)
+        except Exception as e:
+            with self.lock:
+                self.state["error"] = str(e)
+            self.log(f"Acquisition error: {e}")
+
+        with self.lock:
+            self.state["finished"] = time.time()
+            if self.state["error"]:
+                self.state["status"] = "error"
+            elif self.stop_event.is_set():
+                self.state["status"] = "stopped"
+            else:
+                self.state["status"] = "done"
+            captured = self.state["frames_captured"]
+            status = self.state["status"]
+        self.log(f"Acquisition {run_id} {status}: {captured} frames captured")
+        self._maybe_finish_tracking(run_id)
+
+    # `crops` son los recortes del frame para el seguimiento (no van en el
+    # resultado del trabajo, que se sirve como JSON en /api/jobs)
+    def _on_processed(self, run_id, index, job, crops=None):
+        with self.lock:
+            if self.state["run"] != run_id:
+                return
+            tracker = self.tracker
+            if job["status"] == "done":
+                self.state["frames_processed"] += 1
+                if tracker is None:
+                    class_count = self.state["class_count"]
+                    for label, n in job["result"]["class_count"].items():
+                        class_count[label] = class_count.get(label, 0) + n
+            else:
+                self.state["frames_failed"] += 1
+        if tracker is not None:
+            if job["status"] == "done":
+                tracker.frame(index, job["result"]["tracked"], crops)
+            else:
+                tracker.frame(index, None)
+            self._maybe_finish_tracking(run_id)
+
+    # La tanda terminó y todos sus frames tienen resultado: el volumen
+    # analizado es el bombeado entre frames capturados
+    def _maybe_finish_tracking(self, run_id):
+        with self.lock:
+            if self.tracker is None or self.state["run"] != run_id or self.state["finished"] is None:
+                return
+            state = self.state
+            if state["frames_captured"] - state["frames_processed"] - state["frames_failed"] > 0:
+                return
+            tracker = self.tracker
+            volume = state["frames_captured"] * state["steps"] * self.ml_per_step()
+        tracker.finish(volume)
+
+    def status(self):
+        with self.lock:
+            state = dict(self.state)
+            state["class_count"] = dict(state["class_count"])
+            tracker = self.tracker
+        if tracker is not None:
+            state["tracking"] = tracker.status()
+            state["class_count"] = state["tracking"]["class_count"]
+        started = state["started"]
+        if started:
+            elapsed = (state["finished"] or time.time()) - started
+            state["elapsed"] = round(elapsed, 1)
+            state["frames_per_minute"] = round(state["frames_captured"] * 60.0 / elapsed, 2) if elapsed > 0 else 0.0
+        else:
+            state["elapsed"] = 0.0
+            state["frames_per_minute"] = 0.0
+        state["backlog"] = state["frames_captured"] - state["frames_processed"] - state["frames_failed"]
+        return state
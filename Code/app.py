@@ -3,39 +3,66 @@ from flask import Flask, render_template, jsonify, send_file, Response, request
 import time
 import io
 import os
-import subprocess
 import threading
-import json
+import re
+import signal
+import sys
+import csv
 from datetime import datetime
-from queue import Queue
-from threading import Lock
 import cv2
 import numpy as np
-import RPi.GPIO as GPIO
-import math
+import atexit
+from streaming import FrameSource, H264Relay, StreamHub, negotiate_profile
+from hardware import (RPiGPIOBackend, SimulatedCamera, SimulatedFfmpegOutput,
+                      SimulatedH264Encoder, hardware_mode, load_gpio)
+
+# ========== Hardware (Raspberry Pi o simulado) ==========
+GPIO, GPIO_SIMULATED = load_gpio()
 
+CAMERA_SIMULATED = False
 try:
+    if hardware_mode() == "sim":
+        raise ImportError("simulated hardware requested")
     from picamera2 import Picamera2
     from picamera2.encoders import H264Encoder
-    from picamera2.outputs import FileOutput
+    from picamera2.outputs import FfmpegOutput
     CAMERA_AVAILABLE = True
 except ImportError:
     CAMERA_AVAILABLE = False
+    if hardware_mode() != "pi":
+        H264Encoder = SimulatedH264Encoder
+        FfmpegOutput = SimulatedFfmpegOutput
+        CAMERA_AVAILABLE = True
+        CAMERA_SIMULATED = True
 
 # ========== Clasificador de plancton ==========
-try:
-    from ml.classifier import classify_image
-    CLASSIFIER_AVAILABLE = True
-    print("✅ Plankton classifier loaded")
-except Exception as e:
-    CLASSIFIER_AVAILABLE = False
-    print(f"❌ Classifier error: {e}")
+from classification import MODEL_VERSION, CacheStats
+from processing import annotate_frame, classify_crops, process_photo, process_video_frame, write_features
+from jobs import JobQueue
+from acquisition import Acquisition
+from stepper import StepperEngine
+from catalog import Catalog, is_sample, parse_time
+from archive import Entry, StreamingZip
+from logbus import LogBus
+from background import BackgroundModel
+from detection import LiveDetector
+from tracking import SequenceTracker
+from autofocus import Autofocus, luma_roi, sharpness
+from recording import SegmentMonitor, segment_args, segment_pattern
+from video_analysis import VideoAnalysis
+from metrics import Metrics
+from segmentation import STAGES
+from statestore import JsonStore, read_json, write_json_atomic
 
 app = Flask(__name__)
 SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
 FOCUS_STATE_JFILE = os.path.join(os.path.dirname(__file__), "focus_state.json")
 COUNTER_FILE = os.path.join(SAMPLES_DIR, "counter.json")
+CATALOG_FILE = os.path.join(SAMPLES_DIR, "catalog.db")
+SAMPLES_PAGE_SIZE = 100
+CONSOLE_HISTORY = 50
+STATE_SAVE_DELAY = 2.0
 os.makedirs(SAMPLES_DIR, exist_ok=True)
 
 # ========== Variables globales ==========
@@ -48,86 +75,103 @@ def should_clear_annotations():
     current_time = time.time()
     return current_time - last_annotation_time > 10.0
 
-def annotate_frame(frame, classifications):
-    for obj in classifications:
-        x, y, w, h = obj["x"], obj["y"], obj["w"], obj["h"]
-        label = obj["label"]
-        confidence = obj["confidence"]
-        color = (0, 255, 0) if label != "unknown" else (0, 0, 255)
-        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-        label_text = f"{label} ({int(confidence)}%)" if confidence > 0 else "unknown"
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.5
-        thickness = 1
-        text_x = x + 5
-        text_y = y - 10 if y - 10 > 10 else y + h + 20
-        cv2.putText(frame, label_text, (text_x, text_y), font, font_scale, color, thickness)
-    return frame
+# ========== Métricas ==========
+# Series fijadas al arrancar (ver metrics.py). Las etapas de segmentación y
+# la clasificación se miden dentro de los workers y llegan en el resultado
+# de cada trabajo ("timings").
+metrics = Metrics()
+JOB_KINDS = ("photo", "acquisition", "tracks", "video")
+metric_capture = metrics.histogram("planktoscope_capture_seconds", "Time to get a frame from the camera", "stream", ("lores", "main"))
+metric_convert = metrics.histogram("planktoscope_yuv_to_bgr_seconds", "YUV420 to BGR conversion of the preview frame")
+metric_jpeg = metrics.histogram("planktoscope_jpeg_encode_seconds", "JPEG encoding of a stream frame")
+metric_stage = metrics.histogram("planktoscope_segmentation_stage_seconds", "Time spent in each segmentation stage", "stage", STAGES)
+metric_classify = metrics.histogram("planktoscope_classifier_object_seconds", "Classifier latency per object (cache hits excluded)")
+metric_job = metrics.histogram("planktoscope_job_seconds", "Processing job time from submit to result", "kind", JOB_KINDS)
+metric_move = metrics.histogram("planktoscope_stepper_move_seconds", "Stepper move duration", "stepper", ("stepper1", "stepper2"))
+metric_segments = metrics.counter("planktoscope_recording_segments_total", "Finished video recording segments")
+
+def record_job_metrics(job):
+    metric_job.observe(job["finished"] - job["submitted"], job["kind"])
+    if job["status"] != "done" or not isinstance(job["result"], dict):
+        return
+    timings = job["result"].get("timings") or {}
+    for stage, seconds in timings.items():
+        if stage == "classify":
+            metric_classify.observe(seconds / timings["classified"], count=timings["classified"])
+        elif stage != "classified":
+            metric_stage.observe(seconds, stage)
+
+def record_move_metrics(move):
+    if move.started is not None:
+        metric_move.observe(move.finished - move.started, move.stepper)
 
 # ========== Cargar configuración ==========
 def load_config():
     default_config = {
-        "stepper1": {"dir_pin": 26, "step_pin": 19, "enable_pin": 9, "steps_take_sample": 2000, "delay": 0.0005},
-        "stepper2": {"dir_pin": 5, "step_pin": 6, "enable_pin": 13, "steps_focus": 100, "delay": 0.0005, "focus_min": 40, "focus_max": 60}
+        "stepper1": {"dir_pin": 26, "step_pin": 19, "enable_pin": 9, "steps_take_sample": 2000, "delay": 0.0005, "max_speed": 2000, "acceleration": 4000},
+        "stepper2": {"dir_pin": 5, "step_pin": 6, "enable_pin": 13, "steps_focus": 100, "delay": 0.0005, "max_speed": 2000, "acceleration": 4000, "focus_min": 40, "focus_max": 60},
+        "processing": {"workers": 2, "max_pending": 8},
+        "acquisition": {"frames": 100, "steps": 2000, "settle": 1.0, "ml_per_step": 0.0},
+        "simulation": {"source": "samples", "fps": 30},
+        "capture": {"source": "lores", "main_size": [4056, 3040], "lores_size": [640, 480], "tile_size": 1024, "tile_overlap": 64, "tile_workers": 4, "min_area": 100, "max_area_frac": 0.01},
+        "segmentation": {"method": "adaptive", "background": "median", "frames": 8, "refresh": 4, "min_frames": 3, "threshold": 0.15},
+        "overlay": {"enabled": True, "every": 3, "scale": 0.5, "max_fps": 20},
+        "classification": {"cache": True, "cache_size": 512, "cache_ttl": 60, "hash_threshold": 4},
+        "tracking": {"enabled": False, "max_gap": 1, "gate": 1.5, "search": 50, "min_iou": 0.1, "px_per_step": 0.0, "flow_axis": "y"},
+        "autofocus": {"metric": "laplacian", "roi": 0.5, "scale": 0.5, "coarse": 8, "min_step": 1, "settle": 0.1, "frames": 2},
+        "recording": {"segment_seconds": 60, "bitrate": 5000000, "iperiod": 30},
+        "analysis": {"step": 1, "thumb_size": 128},
+        "stream": {"widths": [320, 480, 640], "qualities": [40, 60, 80], "fps": [5, 10, 15, 20],
+                   "default": {"width": 640, "quality": 80, "fps": 20}, "adaptive": True,
+                   "h264_bitrate": 1500000, "h264_iperiod": 15}
     }
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            config = json.load(f)
-            for key in ["stepper1", "stepper2"]:
-                if key not in config:
-                    config[key] = default_config[key]
+    config = read_json(CONFIG_FILE)
+    if isinstance(config, dict):
+        for key in default_config:
+            if key not in config:
+                config[key] = default_config[key]
     else:
+        # Sin fichero o ilegible: se rehace con los valores por defecto
         config = default_config
         save_config(config)
     return config
 
 def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
+    write_json_atomic(CONFIG_FILE, config, indent=4)
 
-# ========== Cargar/guardar estado del foco ==========
-def load_focus_state():
-    default_state = {"step": 100}
-    if os.path.exists(FOCUS_STATE_JFILE):
-        try:
-            with open(FOCUS_STATE_JFILE, "r") as f:
-                return json.load(f)
-        except:
-            pass
-    return default_state
-
-def save_focus_state(state):
-    with open(FOCUS_STATE_JFILE, "w") as f:
-        json.dump(state, f)
-
-# ========== Cargar/guardar contador ==========
-def load_counter():
-    default = {"photo": 0, "video": 0}
-    if os.path.exists(COUNTER_FILE):
-        try:
-            with open(COUNTER_FILE, "r") as f:
-                return json.load(f)
-        except:
-            pass
-    return default
+# ========== Contador y estado del foco ==========
+# Ver statestore.py: los pasos del foco y los contadores sólo cambian en
+# memoria y se guardan agrupados cada STATE_SAVE_DELAY s y al apagar.
+COUNTER_DEFAULT = {"photo": 0, "video": 0, "run": 0}
 
-def save_counter(counter):
-    with open(COUNTER_FILE, "w") as f:
-        json.dump(counter, f)
+# Nombres de muestra que llevan cada contador. Si se perdió la última
+# escritura (o counter.json estaba corrupto) el contador se pone al número
+# más alto en uso, para no sobrescribir muestras existentes. Los nombres
+# antiguos con marca de tiempo (10 cifras) no cuentan.
+COUNTER_PATTERNS = {
+    "photo": re.compile(r"^(?:photo_(\d{1,8})(?:_objects\.csv|\.jpg)|plankton_.+_\d+_(\d{1,8})_annotated\.jpg)$"),
+    "video": re.compile(r"^video_(\d{1,8})(?:_\d{3,})?(?:\.mp4|\.h264|_objects\.csv|_objects\.zip)$"),
+    "run": re.compile(r"^(?:photo_)?run(\d{1,8})_")
+}
+
+def reconcile_counter(store):
+    highest = {key: 0 for key in COUNTER_PATTERNS}
+    with os.scandir(SAMPLES_DIR) as entries:
+        for entry in entries:
+            for key, pattern in COUNTER_PATTERNS.items():
+                match = pattern.match(entry.name)
+                if match:
+                    number = int(next(g for g in match.groups() if g is not None))
+                    highest[key] = max(highest[key], number)
+    behind = {key: n for key, n in highest.items() if n > store.get(key, 0)}
+    if behind:
+        store.update(**behind)
+    return behind
 
 # ========== Rutas y funciones ==========
 @app.route("/")
 def index():
-    files = []
-    for f in os.listdir(SAMPLES_DIR):
-        if f.lower().endswith(('.jpg', '.jpeg', '.mp4', '.txt')):
-            path = os.path.join(SAMPLES_DIR, f)
-            files.append({
-                "id": f,
-                "time": datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S"),
-                "type": "photo" if f.lower().endswith(('.jpg', '.jpeg')) else "video" if f.lower().endswith('.mp4') else "data"
-            })
-    files.sort(key=lambda x: x["time"], reverse=True)
+    files, _ = catalog.query(limit=SAMPLES_PAGE_SIZE)
     return render_template("index.html", initial_samples=files)
 
 @app.route("/api/config", methods=["GET", "POST"])
@@ -143,12 +187,23 @@ def handle_config():
                 new_config[key]["steps_take_sample"] = int(new_config[key].get("steps_take_sample", 2000))
                 new_config[key]["steps_focus"] = int(new_config[key].get("steps_focus", 100))
                 new_config[key]["delay"] = float(new_config[key].get("delay", 0.0005))
+                new_config[key]["max_speed"] = float(new_config[key].get("max_speed", config[key].get("max_speed", 2000)))
+                new_config[key]["acceleration"] = float(new_config[key].get("acceleration", config[key].get("acceleration", 4000)))
+                # Con delay o max_speed a 0 el perfil de velocidad divide por cero
+                if new_config[key]["delay"] <= 0 or new_config[key]["max_speed"] <= 0 or new_config[key]["acceleration"] < 0:
+                    raise ValueError(f"{key}: delay and max_speed must be > 0 and acceleration >= 0")
                 if key == "stepper2":
                     new_config[key]["focus_min"] = int(new_config[key].get("focus_min", 40))
                     new_config[key]["focus_max"] = int(new_config[key].get("focus_max", 60))
+            for key in config:
+                if key not in new_config:
+                    new_config[key] = config[key]
             save_config(new_config)
             config = new_config
             
+            # Los hilos de los motores deben soltar los pines antes de liberarlos
+            stepper_engine.cancel_all()
+            stepper_engine.wait_idle(timeout=2.0)
             GPIO.cleanup()
             GPIO.setmode(GPIO.BCM)
             
@@ -192,272 +247,618 @@ def toggle_led():
     log_to_console(f"LED turned {status}")
     return jsonify(state=led_state, status=status)
 
+# Espera acotada a un movimiento: lo que tardaría al paso más lento del
+# perfil (2 * delay o 1 / max_speed) más un margen. Si no termina a tiempo se
+# cancela y se lanza TimeoutError.
+def wait_move(move, margin=5.0):
+    cfg = config[move.stepper]
+    period = max(2 * cfg.get("delay", 0.0005), 1.0 / cfg.get("max_speed", 2000))
+    if not move.wait(move.steps * period + margin):
+        move.cancel()
+        raise TimeoutError(f"Move {move.id} on {move.stepper} did not finish in time")
+    if move.status == "error":
+        raise RuntimeError(move.error)
+
+# Movimiento bloqueante (para hilos de fondo como la adquisición continua)
 def move_stepper(stepper_key, direction, steps):
-    pin_dir = config[stepper_key]["dir_pin"]
-    pin_step = config[stepper_key]["step_pin"]
-    pin_enable = config[stepper_key]["enable_pin"]
-    delay = config[stepper_key]["delay"]
-    
-    GPIO.output(pin_enable, GPIO.LOW)
-    time.sleep(0.01)
-    GPIO.output(pin_dir, GPIO.HIGH if direction == "forward" else GPIO.LOW)
-    
-    for _ in range(steps):
-        GPIO.output(pin_step, GPIO.HIGH)
-        time.sleep(delay)
-        GPIO.output(pin_step, GPIO.LOW)
-        time.sleep(delay)
-    
-    GPIO.output(pin_enable, GPIO.HIGH)
+    move = stepper_engine.move(stepper_key, direction, steps)
+    wait_move(move)
+    return move
+
+def on_focus_move_done(move):
+    global focus_step
+    # Descontar los pasos que no llegaron a darse (cancelado o error)
+    missing = move.steps - move.steps_done
+    if missing:
+        focus_step += -missing if move.direction == "forward" else missing
+        focus_store.update(step=focus_step)
+        log_to_console(f"Focus move {move.id} {move.status} after {move.steps_done} steps (total: {focus_step})")
 
 @app.route("/api/focus/<direction>")
 def focus(direction):
-    global focus_step, ignore_focus_limits
+    global focus_step
     steps = config["stepper2"]["steps_focus"]
+    move = None
+    # El autofoco mueve el mismo motor y lleva su propia cuenta de la posición
+    if CAMERA_AVAILABLE and autofocus.running():
+        return jsonify(error="Autofocus running"), 409
     
     if direction == "in":
         if not ignore_focus_limits and focus_step + steps > config["stepper2"]["focus_max"]:
             return jsonify(error=f"Focus limit exceeded (max: {config['stepper2']['focus_max']})"), 400
-        move_stepper("stepper2", "forward", steps)
+        move = stepper_engine.move("stepper2", "forward", steps, on_done=on_focus_move_done)
         focus_step += steps
         log_to_console(f"Focus IN: +{steps} steps (total: {focus_step})")
     elif direction == "out":
         if not ignore_focus_limits and focus_step - steps < config["stepper2"]["focus_min"]:
             return jsonify(error=f"Focus limit exceeded (min: {config['stepper2']['focus_min']})"), 400
-        move_stepper("stepper2", "backward", steps)
+        move = stepper_engine.move("stepper2", "backward", steps, on_done=on_focus_move_done)
         focus_step -= steps
         log_to_console(f"Focus OUT: -{steps} steps (total: {focus_step})")
     
-    focus_state["step"] = focus_step
-    save_focus_state(focus_state)
-    return jsonify(step=focus_step)
+    focus_store.update(step=focus_step)
+    return jsonify(step=focus_step, move=move.id if move else None)
 
 @app.route("/api/sample/take")
 def take_sample():
     try:
         steps = config["stepper1"]["steps_take_sample"]
         log_to_console(f"Moving stepper1 ({steps} steps)")
-        move_stepper("stepper1", "forward", steps)
-        return jsonify(sample={"id": "sample_taken", "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "type": "data"})
+        move = stepper_engine.move("stepper1", "forward", steps)
+        return jsonify(move=move.id, sample={"id": "sample_taken", "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "type": "data"})
     except Exception as e:
         log_to_console(f"Sample error: {str(e)}")
         return jsonify(error="Sample failed"), 500
 
+@app.route("/api/moves/<int:move_id>")
+def get_move(move_id):
+    move = stepper_engine.get(move_id)
+    if move is None:
+        return jsonify(error="Move not found"), 404
+    return jsonify(move.to_dict())
+
+@app.route("/api/moves/<int:move_id>/cancel", methods=["POST"])
+def cancel_move(move_id):
+    move = stepper_engine.cancel(move_id)
+    if move is None:
+        return jsonify(error="Move not found"), 404
+    return jsonify(move.to_dict())
+
+@app.route("/api/moves/cancel", methods=["POST"])
+def cancel_all_moves():
+    return jsonify(status="ok", cancelled=stepper_engine.cancel_all())
+
 # ========== Cámara ==========
 if CAMERA_AVAILABLE:
+    def capture_bgr_frame():
+        width, height = LORES_SIZE
+        started = time.perf_counter()
+        yuv_frame = camera.capture_buffer("lores")
+        captured = time.perf_counter()
+        yuv_array = np.frombuffer(yuv_frame, dtype=np.uint8)
+        yuv_reshaped = yuv_array.reshape((height * 3 // 2, width))
+        bgr_frame = cv2.cvtColor(yuv_reshaped, cv2.COLOR_YUV2BGR_I420)
+        metric_capture.observe(captured - started, "lores")
+        metric_convert.observe(time.perf_counter() - captured)
+        return bgr_frame
+
+    # Frame para fotos: el stream "main" a resolución completa (RGB888, que
+    # en Picamera2 ya está en orden BGR) o el lores de la preview
+    def capture_still_frame():
+        if CAPTURE_MAIN:
+            started = time.perf_counter()
+            bgr_frame = camera.capture_array("main")
+            metric_capture.observe(time.perf_counter() - started, "main")
+            return bgr_frame
+        return capture_bgr_frame()
+
+    # Opciones de segmentación por teselas para los trabajos del pool
+    def tiling_options():
+        return config["capture"] if CAPTURE_MAIN else None
+
+    # Fondo para segmentar por sustracción, o None para usar el umbral adaptativo
+    def background_snapshot():
+        if config["segmentation"]["method"] != "background":
+            return None
+        return background_model.snapshot()
+
+    # Imagen anotada reducida al tamaño de la preview para el stream
+    def preview_annotation(bgr_frame, objects):
+        width, height = LORES_SIZE
+        if bgr_frame.shape[1] == width and bgr_frame.shape[0] == height:
+            return annotate_frame(bgr_frame.copy(), objects)
+        sx = width / bgr_frame.shape[1]
+        sy = height / bgr_frame.shape[0]
+        scaled = [dict(obj, x=int(obj["x"] * sx), y=int(obj["y"] * sy), w=max(int(obj["w"] * sx), 1), h=max(int(obj["h"] * sy), 1)) for obj in objects]
+        frame = cv2.resize(bgr_frame, (width, height), interpolation=cv2.INTER_AREA)
+        return annotate_frame(frame, scaled)
+
+    # Frame de la preview (la última imagen anotada o uno en vivo), capturado
+    # una vez y compartido por todas las variantes del stream (FrameSource)
+    def produce_preview_frame():
+        global last_annotated_frame, last_annotation_time
+        if should_clear_annotations():
+            last_annotated_frame = None
+            last_annotation_time = 0
+
+        if last_annotated_frame is not None:
+            frame = last_annotated_frame
+            if live_detector is not None:
+                live_detector.clear()
+        else:
+            frame = capture_bgr_frame()
+            if live_detector is not None:
+                live_detector.feed(frame)
+        return frame
+
+    # Una variante: sólo se reduce, nunca se amplía por encima de la preview
+    def encode_stream_frame(width, quality):
+        frame = preview_source.latest()
+        if frame.shape[1] > width:
+            height = round(frame.shape[0] * width / frame.shape[1])
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        started = time.perf_counter()
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        metric_jpeg.observe(time.perf_counter() - started)
+        if not ret:
+            return None
+        return (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+
+    # ?width=&quality=&fps= se ajustan a los perfiles de config["stream"]
     @app.route("/video_feed")
     def video_feed():
-        def generate_frames():
-            while True:
-                if should_clear_annotations():
-                    global last_annotated_frame, last_annotation_time
-                    last_annotated_frame = None
-                    last_annotation_time = 0
-                
-                if last_annotated_frame is not None:
-                    frame = last_annotated_frame
-                else:
-                    yuv_frame = camera.capture_buffer("lores")
-                    yuv_array = np.frombuffer(yuv_frame, dtype=np.uint8)
-                    yuv_reshaped = yuv_array.reshape((480 * 3 // 2, 640))
-                    frame = cv2.cvtColor(yuv_reshaped, cv2.COLOR_YUV2BGR_I420)
-                
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-                time.sleep(0.05)
-        return Response(generate_frames(),
+        try:
+            profile = negotiate_profile(request.args, config["stream"])
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        return Response(stream_hub.stream(profile),
                         mimetype='multipart/x-mixed-replace; boundary=frame')
 
+    # H.264 del encoder hardware sin recodificar (Annex B), para clientes que
+    # lo decodifican (ffplay, JMuxer...). Usa un encoder propio sobre lores,
+    # independiente del de la grabación.
+    def start_stream_encoder(output):
+        global stream_encoder
+        params = config["stream"]
+        stream_encoder = H264Encoder(params["h264_bitrate"], repeat=True, iperiod=params["h264_iperiod"])
+        camera.start_encoder(stream_encoder, output, name="lores")
+
+    def stop_stream_encoder():
+        camera.stop_encoder(stream_encoder)
+
+    @app.route("/video_feed.h264")
+    def video_feed_h264():
+        if h264_relay is None:
+            return jsonify(error="H.264 streaming needs the camera hardware encoder"), 404
+        return Response(h264_relay.subscribe(), mimetype="video/h264", headers={"Cache-Control": "no-cache"})
+
+    # Perfiles que ofrece el servidor y variantes en uso
+    @app.route("/api/stream")
+    def stream_status():
+        params = config["stream"]
+        stats = stream_hub.stats()
+        stats.update(
+            widths=params["widths"], qualities=params["qualities"], fps=params["fps"], default=params["default"],
+            adaptive=params["adaptive"], h264=h264_relay is not None,
+            h264_clients=h264_relay.client_count() if h264_relay is not None else 0
+        )
+        return jsonify(stats)
+
+    # Cajas de la detección en vivo; el navegador las dibuja sobre /video_feed
+    @app.route("/api/overlay")
+    def overlay():
+        if live_detector is None:
+            return jsonify(error="Overlay disabled"), 404
+        return jsonify(live_detector.snapshot())
+
+    @app.route("/api/overlay/stream")
+    def overlay_stream():
+        if live_detector is None:
+            return jsonify(error="Overlay disabled"), 404
+        return Response(live_detector.sse(max_fps=config["overlay"]["max_fps"]),
+                        mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    def on_photo_processed(job, bgr_frame):
+        global last_annotated_frame, last_annotation_time
+        if job["status"] != "done":
+            log_to_console(f"Photo processing error: {job['error']}")
+            return
+        result = job["result"]
+        cache_stats.add(result["cache"])
+        catalog.add(result["file"], result["objects"])
+        if result["features_file"]:
+            catalog.add(result["features_file"])
+        for line in result["log"]:
+            log_to_console(line)
+
+        # Actualizar la última imagen anotada
+        last_annotated_frame = preview_annotation(bgr_frame, result["objects"])
+        last_annotation_time = time.time()
+
     @app.route("/api/capture/photo")
     def capture_photo():
-        global counter, last_annotated_frame, last_annotation_time
-        counter["photo"] += 1
-        save_counter(counter)
-        img_filename = f"photo_{counter['photo']}.jpg"
+        if job_queue.is_full():
+            response = jsonify({"error": "Processing queue full"})
+            response.headers["Retry-After"] = "2"
+            return response, 503
+
+        photo_number = counter_store.increment("photo")
+        img_filename = f"photo_{photo_number}.jpg"
         img_path = os.path.join(SAMPLES_DIR, img_filename)
         
         try:
-            yuv_frame = camera.capture_buffer("lores")
-            yuv_array = np.frombuffer(yuv_frame, dtype=np.uint8)
-            yuv_reshaped = yuv_array.reshape((480 * 3 // 2, 640))
-            bgr_frame = cv2.cvtColor(yuv_reshaped, cv2.COLOR_YUV2BGR_I420)
+            bgr_frame = capture_still_frame()
             
             # Guardar imagen original
             cv2.imwrite(img_path, bgr_frame)
+            catalog.add(img_filename)
             log_to_console(f"Image captured: {img_filename}")
-            
-            H, W = bgr_frame.shape[:2]
-            gray = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2GRAY)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            gray = clahe.apply(gray)
-            blur = cv2.GaussianBlur(gray, (5,5), 0)
-            th = cv2.adaptiveThreshold(
-                blur, 255,
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY_INV,
-                31, 3
-            )
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
-            th = cv2.morphologyEx(th, cv2.MORPH_OPEN, kernel, iterations=2)
-            cnts, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            min_area = 0.0005 * H * W
-            max_area = 0.01 * H * W
-            
-            classifications = []
-            for c in cnts:
-                area = cv2.contourArea(c)
-                if area < min_area or area > max_area:
-                    continue
-                
-                peri = cv2.arcLength(c, True)
-                if peri == 0:
-                    continue
-                    
-                circularity = 4 * math.pi * area / (peri * peri)
-                elongation = 1.0
-                if len(c) >= 5:
-                    (_, _), (MA, ma), _ = cv2.fitEllipse(c)
-                    if MA > 0:
-                        elongation = ma / MA
-                
-                x, y, w, h = cv2.boundingRect(c)
-                obj_img = bgr_frame[y:y+h, x:x+w]
-                obj_path = os.path.join(SAMPLES_DIR, f"temp_obj_{counter['photo']}_{len(classifications)}.jpg")
-                cv2.imwrite(obj_path, obj_img)
-                
-                result = {"label": "unknown", "confidence": 0.0}
-                if CLASSIFIER_AVAILABLE:
-                    try:
-                        result = classify_image(obj_path)
-                        log_to_console(f"Object classification: {result['label']} ({result['confidence']:.1f}%)")
-                    except Exception as e:
-                        log_to_console(f"Classification error: {e}")
-                        result = {"label": "error", "confidence": 0.0}
-                
-                classifications.append({
-                    "x": x,
-                    "y": y,
-                    "w": w,
-                    "h": h,
-                    "label": result["label"],
-                    "confidence": result["confidence"]
-                })
-                os.remove(obj_path)
-            
-            # Generar resumen
-            class_count = {}
-            for obj in classifications:
-                label = obj["label"]
-                class_count[label] = class_count.get(label, 0) + 1
-            
-            if class_count:
-                class_list = ", ".join([f"{k}: {v}" for k, v in class_count.items()])
-                log_to_console(f"Classification summary: {class_list}")
-            else:
-                class_list = "No objects classified"
-                log_to_console(class_list)
-            
-            # Dibujar anotaciones
-            annotated_frame = bgr_frame.copy()
-            for obj in classifications:
-                x, y, w, h = obj["x"], obj["y"], obj["w"], obj["h"]
-                label = obj["label"]
-                confidence = obj["confidence"]
-                color = (0, 255, 0) if label != "unknown" else (0, 0, 255)
-                cv2.rectangle(annotated_frame, (x, y), (x+w, y+h), color, 2)
-                label_text = f"{label} ({int(confidence)}%)" if confidence > 0 else "unknown"
-                cv2.putText(annotated_frame, label_text, (x+5, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-            
-            # Actualizar la última imagen anotada
-            last_annotated_frame = annotated_frame
-            last_annotation_time = time.time()
-            
-            # ✅ Guardar la imagen ANOTADA con el nombre clasificado
-            if classifications:
-                first_class = classifications[0]["label"]
-                first_conf = int(classifications[0]["confidence"])
-                annotated_filename = f"plankton_{first_class}_{first_conf}_{counter['photo']}_annotated.jpg"
-                annotated_path = os.path.join(SAMPLES_DIR, annotated_filename)
-                cv2.imwrite(annotated_path, annotated_frame)
-                log_to_console(f"Annotated image saved: {annotated_filename}")
-                final_filename = annotated_filename
-            else:
-                final_filename = img_filename
-            
-            return jsonify({
-                "status": "ok",
-                "file": final_filename,
-                "class": "multiple",
-                "confidence": 0.0,
-                "objects": classifications,
-                "summary": class_list
-            })
-            
         except Exception as e:
             log_to_console(f"Photo capture error: {e}")
             return jsonify({"error": "Capture failed"}), 500
 
+        # Segmentación y clasificación en el pool de procesos. Las fotos sueltas
+        # usan siempre el umbral adaptativo: el fondo sólo es válido dentro de
+        # la adquisición que lo ha construido
+        job_id = job_queue.submit(
+            "photo", process_photo, bgr_frame, photo_number, img_filename, SAMPLES_DIR, tiling_options(),
+            None, config["segmentation"]["threshold"], config["classification"],
+            on_done=lambda job: on_photo_processed(job, bgr_frame)
+        )
+        if job_id is None:
+            response = jsonify({"error": "Processing queue full", "file": img_filename})
+            response.headers["Retry-After"] = "2"
+            return response, 503
+        return jsonify({"status": "queued", "job": job_id, "file": img_filename}), 202
+
+    # ========== Adquisición continua ==========
+    def acquisition_photo_id(run_id, index):
+        return f"run{run_id}_{index + 1:04d}"
+
+    def acquisition_capture(run_id, index):
+        photo_id = acquisition_photo_id(run_id, index)
+        img_filename = f"photo_{photo_id}.jpg"
+        bgr_frame = capture_still_frame()
+        cv2.imwrite(os.path.join(SAMPLES_DIR, img_filename), bgr_frame)
+        catalog.add(img_filename)
+        # El fondo se toma antes de añadir este frame al modelo. Sólo la
+        # adquisición lo actualiza: entre frames la bomba mueve la muestra,
+        # mientras que fotos sueltas repetidas meterían los objetos en el fondo.
+        background = background_snapshot()
+        background_model.update(bgr_frame)
+        return bgr_frame, photo_id, img_filename, background
+
+    def acquisition_submit(frame, on_done):
+        bgr_frame, photo_id, img_filename, background = frame
+
+        def on_frame_processed(job):
+            crops = None
+            if job["status"] == "done":
+                crops = job["result"].pop("crops", None)
+                cache_stats.add(job["result"]["cache"])
+                catalog.add(job["result"]["file"], job["result"]["objects"])
+                if job["result"]["features_file"]:
+                    catalog.add(job["result"]["features_file"])
+                log_to_console(f"{img_filename}: {job['result']['summary']}")
+            else:
+                log_to_console(f"{img_filename} processing error: {job['error']}")
+            on_done(job, crops)
+
+        job_id = job_queue.submit(
+            "acquisition", process_photo, bgr_frame, photo_id, img_filename, SAMPLES_DIR, tiling_options(),
+            background, config["segmentation"]["threshold"], config["classification"], tracking_ready(),
+            on_done=on_frame_processed, block=True, timeout=1.0
+        )
+        return job_id is not None
+
+    # ========== Seguimiento y recuento por organismo ==========
+    # Los recortes más enfocados de las pistas cerradas se clasifican en el
+    # pool. Estos trabajos se lanzan desde callbacks de otros trabajos, así
+    # que no esperan hueco en la cola (bypass).
+    def classify_tracks(crops, on_done):
+        def on_classified(job):
+            if job["status"] != "done":
+                log_to_console(f"Track classification error: {job['error']}")
+                on_done(None)
+                return
+            cache_stats.add(job["result"]["cache"])
+            on_done(job["result"]["results"])
+
+        job_id = job_queue.submit(
+            "tracks", classify_crops, crops, SAMPLES_DIR, config["classification"],
+            on_done=on_classified, bypass=True
+        )
+        if job_id is None:
+            on_done(None)
+
+    def on_tracking_report(tracker, report):
+        run_id = report["run"]
+        tracks_filename = f"run{run_id}_tracks.csv"
+        counts_filename = f"run{run_id}_counts.csv"
+        tracker.write_tracks(os.path.join(SAMPLES_DIR, tracks_filename))
+        tracker.write_counts(os.path.join(SAMPLES_DIR, counts_filename), report)
+        catalog.add(tracks_filename)
+        catalog.add(counts_filename)
+        # Cada frame recibe ahora su tabla de medidas y sus objetos en el
+        # catálogo, con la etiqueta del organismo de cada objeto
+        for index, objects, classifications in tracker.labeled_frames():
+            photo_id = acquisition_photo_id(run_id, index)
+            if objects:
+                features_filename = f"photo_{photo_id}_objects.csv"
+                write_features(os.path.join(SAMPLES_DIR, features_filename), objects, classifications)
+                catalog.add(features_filename)
+            catalog.add(f"photo_{photo_id}.jpg", classifications)
+        summary = ", ".join(f"{k}: {v}" for k, v in report["class_count"].items()) or "no organisms"
+        log_to_console(f"Run {run_id}: {report['tracks']} organisms tracked ({summary})")
+        if report["total_per_ml"] is not None:
+            log_to_console(f"Run {run_id}: {report['total_per_ml']} organisms/mL in {report['volume_ml']:.3f} mL")
+        else:
+            log_to_console(f"Run {run_id}: set acquisition.ml_per_step to report concentration")
+
+    # Sin calibrar (px_per_step <= 0) la predicción no se mueve y dos
+    # organismos distintos en posiciones cercanas de frames consecutivos se
+    # tomarían por el mismo: entonces cada frame se clasifica por separado
+    def tracking_ready():
+        tracking = config["tracking"]
+        return bool(tracking["enabled"]) and tracking["px_per_step"] > 0
+
+    def make_tracker(run_id, steps):
+        tracking = config["tracking"]
+        if not tracking_ready():
+            if tracking["enabled"]:
+                log_to_console(f"Run {run_id}: set tracking.px_per_step to track organisms, counting per frame")
+            return None
+        # Desplazamiento esperado por frame a partir de los pasos de la bomba
+        shift = tracking["px_per_step"] * steps
+        flow = (shift, 0.0) if tracking["flow_axis"] == "x" else (0.0, shift)
+        return SequenceTracker(
+            run_id, flow=flow, max_gap=tracking["max_gap"], gate=tracking["gate"],
+            search=tracking["search"], min_iou=tracking["min_iou"], classify=classify_tracks, on_report=on_tracking_report
+        )
+
+    acquisition = Acquisition(
+        pump=lambda steps: move_stepper("stepper1", "forward", steps),
+        capture=acquisition_capture,
+        submit=acquisition_submit,
+        log=lambda msg: log_to_console(msg),
+        make_tracker=make_tracker,
+        ml_per_step=lambda: config["acquisition"].get("ml_per_step", 0.0)
+    )
+
+    @app.route("/api/acquisition/start", methods=["POST"])
+    def start_acquisition():
+        params = request.get_json(silent=True) or {}
+        try:
+            frames = int(params.get("frames", config["acquisition"]["frames"]))
+            steps = int(params.get("steps", config["acquisition"]["steps"]))
+            settle = float(params.get("settle", config["acquisition"]["settle"]))
+        except (TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        if frames <= 0 or steps < 0 or settle < 0:
+            return jsonify(error="Invalid acquisition parameters"), 400
+        if acquisition.running():
+            return jsonify(error="Acquisition already running"), 409
+
+        # Cada adquisición construye su fondo desde cero: el de una muestra
+        # anterior no sirve para la nueva
+        background_model.reset()
+        run = counter_store.increment("run")
+        acquisition.start(run, frames, steps, settle)
+        return jsonify(status="ok", run=run)
+
+    @app.route("/api/acquisition/stop", methods=["POST"])
+    def stop_acquisition():
+        if not acquisition.stop():
+            return jsonify(error="No acquisition running"), 400
+        stepper_engine.cancel_all("stepper1")
+        return jsonify(status="ok")
+
+    @app.route("/api/acquisition/status")
+    def acquisition_status():
+        return jsonify(acquisition.status())
+
+    @app.route("/api/background")
+    def background_status():
+        return jsonify(background_model.status())
+
+    # ========== Autoenfoque ==========
+    def focus_move_to(position):
+        global focus_step
+        delta = position - focus_step
+        if delta == 0:
+            return
+        move = stepper_engine.move("stepper2", "forward" if delta > 0 else "backward", abs(delta), on_done=on_focus_move_done)
+        focus_step = position
+        focus_store.update(step=focus_step)
+        wait_move(move)
+
+    def focus_measure():
+        params = config["autofocus"]
+        width, height = LORES_SIZE
+        roi = luma_roi(camera.capture_buffer("lores"), width, height, params["roi"], params["scale"])
+        return sharpness(roi, params["metric"])
+
+    autofocus = Autofocus(focus_move_to, focus_measure, log=lambda msg: log_to_console(msg))
+
+    @app.route("/api/focus/auto", methods=["GET", "POST"])
+    def auto_focus():
+        if request.method == "GET":
+            return jsonify(autofocus.status())
+        if acquisition.running():
+            return jsonify(error="Acquisition running"), 409
+        params = config["autofocus"]
+        lo, hi = config["stepper2"]["focus_min"], config["stepper2"]["focus_max"]
+        if hi <= lo:
+            return jsonify(error="Invalid focus range"), 400
+        if not autofocus.start(lo, hi, params["coarse"], params["min_step"], params["settle"], params["frames"]):
+            return jsonify(error="Autofocus already running"), 409
+        return jsonify(status="ok", range=[lo, hi]), 202
+
+    @app.route("/api/focus/auto/stop", methods=["POST"])
+    def stop_auto_focus():
+        if not autofocus.stop():
+            return jsonify(error="Autofocus not running"), 400
+        return jsonify(status="ok")
+
+    @app.route("/api/background/reset", methods=["POST"])
+    def background_reset():
+        background_model.reset()
+        log_to_console("Background model reset")
+        return jsonify(background_model.status())
+
+    def on_segment_finished(filename):
+        metric_segments.inc()
+        catalog.add(filename)
+        log_to_console(f"Video segment saved: {filename}")
+
     @app.route("/api/capture/video/<action>")
     def capture_video(action):
-        global recording, video_encoder, video_output
+        global recording, video_encoder, video_output, video_monitor
         if action == "start" and not recording:
-            global counter
-            counter["video"] += 1
-            save_counter(counter)
-            filename = f"video_{counter['video']}.h264"
-            path = os.path.join(SAMPLES_DIR, filename)
-            video_encoder = H264Encoder(5000000)
-            video_output = FileOutput(path)
-            camera.start_recording(video_encoder, video_output, name="lores")
+            params = config["recording"]
+            prefix = f"video_{counter_store.increment('video')}"
+            pattern = os.path.join(SAMPLES_DIR, segment_pattern(prefix))
+            # Un keyframe (con cabeceras repetidas) cada iperiod frames: los
+            # segmentos sólo pueden cortarse en keyframes
+            video_encoder = H264Encoder(params["bitrate"], repeat=True, iperiod=params["iperiod"])
+            video_output = FfmpegOutput(segment_args(pattern, params["segment_seconds"]))
+            video_monitor = SegmentMonitor(SAMPLES_DIR, prefix, on_segment_finished)
+            camera.start_encoder(video_encoder, video_output, name="lores")
             recording = True
-            app.h264_path = path
-            app.mp4_path = path.replace(".h264", ".mp4")
-            log_to_console(f"Video started: {filename}")
-            return jsonify(status="ok", file=filename)
-            
+            log_to_console(f"Video started: {segment_pattern(prefix)} ({params['segment_seconds']}s segments)")
+            return jsonify(status="ok", file=segment_pattern(prefix))
+
         elif action == "stop" and recording:
-            def stop_and_convert():
+            monitor = video_monitor
+            encoder = video_encoder
+
+            # stop_encoder espera a que ffmpeg cierre el último segmento. Sólo
+            # se para este encoder: la cámara y el stream H.264 siguen
+            def stop_recording():
                 try:
-                    camera.stop_recording()
+                    camera.stop_encoder(encoder)
                     log_to_console("Recording stopped.")
                 except Exception as e:
                     log_to_console(f"Stop error: {e}")
-                h264_path = getattr(app, 'h264_path', None)
-                mp4_path = getattr(app, 'mp4_path', None)
-                if h264_path and mp4_path and os.path.exists(h264_path):
-                    log_to_console("Converting to MP4...")
-                    try:
-                        subprocess.run([
-                            "ffmpeg", "-r", "30", "-i", h264_path,
-                            "-c:v", "copy", mp4_path
-                        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                        os.remove(h264_path)
-                        log_to_console(f"Video saved: {os.path.basename(mp4_path)}")
-                    except Exception as e:
-                        log_to_console(f"MP4 failed: {str(e)}")
-
-            convert_thread = threading.Thread(target=stop_and_convert)
-            convert_thread.start()
+                monitor.stop()
+
+            threading.Thread(target=stop_recording, name="video-stop").start()
             recording = False
             return jsonify(status="ok")
+
+        elif action == "segments":
+            if video_monitor is None:
+                return jsonify(recording=recording, finished=[], current=None)
+            return jsonify(recording=recording, **video_monitor.status())
         return jsonify(status="error"), 400
 
+def sample_filters():
+    return {
+        "type": request.args.get("type"),
+        "since": parse_time(request.args.get("from")),
+        "until": parse_time(request.args.get("to"), end=True),
+        "label": request.args.get("label")
+    }
+
 @app.route("/api/samples")
 def list_samples():
-    files = []
-    for f in os.listdir(SAMPLES_DIR):
-        if f.lower().endswith(('.jpg', '.jpeg', '.mp4', '.txt')):
-            path = os.path.join(SAMPLES_DIR, f)
-            files.append({
-                "id": f,
-                "time": datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S"),
-                "type": "photo" if f.lower().endswith(('.jpg', '.jpeg')) else "video" if f.lower().endswith('.mp4') else "data"
-            })
-    files.sort(key=lambda x: x["time"], reverse=True)
-    return jsonify(files)
+    try:
+        limit = min(max(int(request.args.get("limit", SAMPLES_PAGE_SIZE)), 1), 1000)
+        files, next_cursor = catalog.query(
+            cursor=request.args.get("cursor"),
+            limit=limit,
+            **sample_filters()
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    labels = catalog.labels([f["id"] for f in files])
+    for f in files:
+        f["labels"] = labels.get(f["id"], [])
+    return jsonify(items=files, next_cursor=next_cursor)
+
+@app.route("/api/jobs")
+def list_jobs():
+    return jsonify(job_queue.stats())
+
+# Aciertos/fallos de la caché de clasificación sumados sobre todos los workers
+@app.route("/api/classifier/cache")
+def classifier_cache():
+    stats = cache_stats.snapshot()
+    stats.update(config["classification"], model_version=MODEL_VERSION)
+    return jsonify(stats)
+
+@app.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    return jsonify(job)
+
+# ========== Análisis de vídeos grabados ==========
+# Fondo propio: los frames de una grabación no deben alterar el modelo de la
+# adquisición, y al revés
+def video_submit(frame, index, on_done):
+    if not video_slots.acquire(timeout=1.0):
+        return False
+    background = None
+    if config["segmentation"]["method"] == "background":
+        background = video_background.snapshot()
+        video_background.update(frame)
+
+    def on_frame_processed(job):
+        video_slots.release()
+        thumbnails = None
+        if job["status"] == "done":
+            thumbnails = job["result"].pop("thumbnails", None)
+            cache_stats.add(job["result"]["cache"])
+        on_done(job, thumbnails)
+
+    job_id = job_queue.submit(
+        "video", process_video_frame, frame, index, SAMPLES_DIR, config["analysis"]["thumb_size"],
+        None, background, config["segmentation"]["threshold"], config["classification"],
+        on_done=on_frame_processed, block=True, timeout=1.0
+    )
+    if job_id is None:
+        video_slots.release()
+        return False
+    return True
+
+def on_video_analysis_finished(outputs):
+    for filename in outputs:
+        catalog.add(filename)
+
+@app.route("/api/analysis/video", methods=["GET", "POST"])
+def analyze_video():
+    if request.method == "GET":
+        return jsonify(video_analysis.status())
+    params = request.get_json(silent=True) or {}
+    filename = params.get("file", "")
+    if os.path.basename(filename) != filename or not filename.lower().endswith(('.mp4', '.h264')):
+        return jsonify(error="Invalid video file"), 400
+    if not os.path.exists(os.path.join(SAMPLES_DIR, filename)):
+        return jsonify(error="Video not found"), 404
+    # La adquisición necesita la cola para no perder frames
+    if CAMERA_AVAILABLE and acquisition.running():
+        return jsonify(error="Acquisition running"), 409
+    try:
+        step = max(int(params.get("step", config["analysis"]["step"])), 1)
+    except (TypeError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    video_background.reset()
+    try:
+        started = video_analysis.start(filename, step)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if not started:
+        return jsonify(error="Video analysis already running"), 409
+    return jsonify(status="ok", file=filename, outputs=video_analysis.status()["outputs"]), 202
+
+@app.route("/api/analysis/video/stop", methods=["POST"])
+def stop_video_analysis():
+    if not video_analysis.stop():
+        return jsonify(error="No video analysis running"), 400
+    return jsonify(status="ok")
 
 @app.route("/download/<filename>")
 def download_sample(filename):
@@ -466,16 +867,67 @@ def download_sample(filename):
         return send_file(path, as_attachment=True)
     return "File not found", 404
 
+# manifest.csv trozo a trozo desde el catálogo: nunca está entero en memoria
+def manifest_chunks(files, chunk_size=64 * 1024):
+    times = {f["id"]: f["time"] for f in files}
+
+    def chunks():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["sample", "time", "object", "x", "y", "w", "h", "label", "confidence"])
+        for sample_id, idx, x, y, w, h, label, confidence in catalog.objects(list(times)):
+            writer.writerow([sample_id, times[sample_id], idx, x, y, w, h, label, confidence])
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+    return chunks
+
+# ZIP en streaming de las muestras filtradas (type, from, to, label) más un
+# manifest.csv con la clasificación de cada objeto. Admite Range/If-Range
+# para reanudar descargas interrumpidas.
 @app.route("/download/all")
 def download_all():
-    files = "\n".join(os.listdir(SAMPLES_DIR))
-    return send_file(io.BytesIO(files.encode()), mimetype="text/plain", as_attachment=True, download_name="all_samples.txt")
+    try:
+        files = catalog.query_all(**sample_filters())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    # Tamaño y fecha del catálogo, sin un stat por fichero
+    entries = [Entry(f["id"], f["size"], f["mtime"], path=os.path.join(SAMPLES_DIR, f["id"])) for f in files]
+    manifest_mtime = max((e.mtime for e in entries), default=0)
+    entries.append(Entry.from_chunks("manifest.csv", manifest_chunks(files), mtime=manifest_mtime))
+    archive = StreamingZip(entries)
+    etag = archive.etag()
+
+    start, end = 0, archive.size
+    status = 200
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{etag}"',
+        "Content-Disposition": "attachment; filename=all_samples.zip"
+    }
+    if_range = request.headers.get("If-Range")
+    if request.range is not None and (if_range is None or if_range.strip('"') == etag):
+        bounds = request.range.range_for_length(archive.size)
+        if bounds is None:
+            headers["Content-Range"] = f"bytes */{archive.size}"
+            return Response(status=416, headers=headers)
+        start, end = bounds
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{archive.size}"
+    headers["Content-Length"] = str(end - start)
+
+    return Response(archive.iter_range(start, end), status=status, headers=headers,
+                    mimetype="application/zip", direct_passthrough=True)
 
 @app.route("/api/samples/delete/<filename>", methods=["DELETE"])
 def delete_sample(filename):
     path = os.path.join(SAMPLES_DIR, filename)
     if os.path.exists(path):
         os.remove(path)
+        catalog.remove(filename)
         log_to_console(f"File deleted: {filename}")
         return jsonify(status="ok")
     return "File not found", 404
@@ -483,32 +935,35 @@ def delete_sample(filename):
 @app.route("/api/samples/delete/all", methods=["DELETE"])
 def delete_all_samples():
     for f in os.listdir(SAMPLES_DIR):
-        if f.lower().endswith(('.jpg', '.jpeg', '.mp4', '.txt')):
+        if is_sample(f):
             path = os.path.join(SAMPLES_DIR, f)
             os.remove(path)
-    global counter
-    counter = {"photo": 0, "video": 0}
-    save_counter(counter)
+    catalog.clear()
+    counter_store.update(**COUNTER_DEFAULT)
     log_to_console("All samples deleted")
     return jsonify(status="ok")
 
+# Formato de texto de Prometheus
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route("/api/console/stream")
 def console_stream():
-    def generate():
-        yield " Modular PlanktoScope console connected.\n\n"
-        while True:
-            if not log_queue.empty():
-                with log_lock:
-                    msg = log_queue.get()
-                yield f" {msg}\n\n"
-            time.sleep(0.3)
-    return Response(generate(), mimetype="text/event-stream")
+    cursor = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        cursor = int(cursor) if cursor else max(log_bus.last_seq() - CONSOLE_HISTORY, 0)
+    except ValueError:
+        cursor = None
+    return Response(log_bus.sse(cursor, greeting=" Modular PlanktoScope console connected."),
+                    mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # ========== Inicialización final ==========
 config = load_config()
-focus_state = load_focus_state()
-focus_step = focus_state["step"]
-counter = load_counter()
+focus_store = JsonStore(FOCUS_STATE_JFILE, {"step": 100}, delay=STATE_SAVE_DELAY)
+focus_step = focus_store.get("step")
+counter_store = JsonStore(COUNTER_FILE, COUNTER_DEFAULT, delay=STATE_SAVE_DELAY)
+counter_behind = reconcile_counter(counter_store)
 
 # ========== GPIO ==========
 GPIO.setmode(GPIO.BCM)
@@ -522,34 +977,126 @@ GPIO.setup(config["stepper2"]["step_pin"], GPIO.OUT)
 GPIO.setup(config["stepper2"]["enable_pin"], GPIO.OUT)
 GPIO.output(config["stepper2"]["enable_pin"], GPIO.HIGH)
 
+gpio_backend = RPiGPIOBackend(GPIO)
+stepper_engine = StepperEngine(gpio_backend, lambda key: config[key], observe=record_move_metrics,
+                               log=lambda msg: log_to_console(msg))
+
 LED_PIN = 11
 GPIO.setup(LED_PIN, GPIO.OUT)
 GPIO.output(LED_PIN, GPIO.HIGH)
 led_state = False
 
+job_queue = JobQueue(
+    max_workers=config["processing"]["workers"],
+    max_pending=config["processing"]["max_pending"],
+    observe=record_job_metrics,
+    log=lambda msg: log_to_console(msg)
+)
+job_queue.start()
+cache_stats = CacheStats()
+metrics.gauge("planktoscope_jobs_pending", "Processing jobs queued or running",
+              lambda: job_queue.stats()["pending"])
+metrics.counter_callback("planktoscope_jobs_total", "Finished or rejected processing jobs",
+                         lambda: {k: v for k, v in job_queue.stats().items() if k in ("completed", "failed", "rejected")},
+                         label="status")
+atexit.register(job_queue.shutdown)
+# El análisis de vídeo ocupa como mucho la mitad de la cola: las fotos y la
+# adquisición siempre encuentran hueco
+video_slots = threading.Semaphore(max(config["processing"]["max_pending"] // 2, 1))
+
+background_model = BackgroundModel(
+    method=config["segmentation"]["background"],
+    frames=config["segmentation"]["frames"],
+    refresh=config["segmentation"]["refresh"],
+    min_frames=config["segmentation"]["min_frames"]
+)
+
+video_background = BackgroundModel(
+    method=config["segmentation"]["background"],
+    frames=config["segmentation"]["frames"],
+    refresh=config["segmentation"]["refresh"],
+    min_frames=config["segmentation"]["min_frames"]
+)
+
+catalog = Catalog(CATALOG_FILE, SAMPLES_DIR)
+catalog.reconcile()
+
+video_analysis = VideoAnalysis(
+    SAMPLES_DIR, video_submit,
+    log=lambda msg: log_to_console(msg),
+    on_finished=on_video_analysis_finished
+)
+
 camera = None
 video_encoder = None
 video_output = None
+video_monitor = None
 recording = False
+stream_encoder = None
 
-log_queue = Queue()
-log_lock = Lock()
+# Los tamaños de la cámara se leen al arrancar
+LORES_SIZE = tuple(config["capture"]["lores_size"])
+CAPTURE_MAIN = config["capture"]["source"] == "main"
+
+log_bus = LogBus(capacity=1000, max_backlog=200)
 
 def log_to_console(msg):
-    with log_lock:
-        log_queue.put(f"[{time.strftime('%H:%M:%S')}] {msg}")
+    log_bus.publish(f"[{time.strftime('%H:%M:%S')}] {msg}")
 
 if CAMERA_AVAILABLE:
-    camera = Picamera2()
-    cam_config = camera.create_preview_configuration(lores={"size": (640, 480), "format": "YUV420"})
+    if CAMERA_SIMULATED:
+        sim = config["simulation"]
+        camera = SimulatedCamera(os.path.join(os.path.dirname(__file__), sim["source"]), fps=sim["fps"])
+        log_to_console(f"Simulated camera: {sim['source']} at {sim['fps']} fps")
+    else:
+        camera = Picamera2()
+    if CAPTURE_MAIN:
+        # Dos buffers bastan y limitan la memoria con frames de 12 MP
+        cam_config = camera.create_preview_configuration(
+            main={"size": tuple(config["capture"]["main_size"]), "format": "RGB888"},
+            lores={"size": LORES_SIZE, "format": "YUV420"},
+            buffer_count=2
+        )
+    else:
+        cam_config = camera.create_preview_configuration(lores={"size": LORES_SIZE, "format": "YUV420"})
     camera.configure(cam_config)
     camera.start()
-    log_to_console("Camera started")
+    live_detector = None
+    if config["overlay"]["enabled"]:
+        live_detector = LiveDetector(every=config["overlay"]["every"], scale=config["overlay"]["scale"])
+    preview_source = FrameSource(produce_preview_frame, max_fps=max(config["stream"]["fps"]))
+    stream_hub = StreamHub(encode_stream_frame, config["stream"]["qualities"], adaptive=config["stream"]["adaptive"])
+    # La cámara simulada no tiene encoder H.264
+    h264_relay = None if CAMERA_SIMULATED else H264Relay(start_stream_encoder, stop_stream_encoder)
+    metrics.gauge("planktoscope_stream_clients", "Connected /video_feed clients",
+                  lambda: stream_hub.stats()["clients"])
+    metrics.counter_callback("planktoscope_stream_frames_total", "Frames encoded for /video_feed (all variants)",
+                             lambda: stream_hub.stats()["frames"])
+    metrics.counter_callback("planktoscope_stream_dropped_frames_total", "Frames skipped by slow /video_feed clients",
+                             lambda: stream_hub.stats()["dropped"])
+    metrics.counter_callback("planktoscope_stream_downgrades_total", "Quality steps down due to send backpressure",
+                             lambda: stream_hub.stats()["downgrades"])
+    if h264_relay is not None:
+        metrics.gauge("planktoscope_h264_clients", "Connected /video_feed.h264 clients", h264_relay.client_count)
+    if CAPTURE_MAIN:
+        width, height = config["capture"]["main_size"]
+        log_to_console(f"Camera started (photos at {width}x{height}, tiled segmentation)")
+    else:
+        log_to_console("Camera started")
 
-import atexit
+atexit.register(focus_store.flush)
+atexit.register(counter_store.flush)
 atexit.register(GPIO.cleanup)
+if counter_store.corrupt:
+    log_to_console("counter.json was unreadable: counters rebuilt from samples")
+if counter_behind:
+    log_to_console("Counters moved past existing samples: " + ", ".join(f"{k}={v}" for k, v in counter_behind.items()))
+if GPIO_SIMULATED:
+    log_to_console("Simulated GPIO")
 
 if __name__ == "__main__":
     log_to_console("Modular PlanktoScope started")
     ignore_focus_limits = False
+    # Con SIGTERM (systemd) salir por sys.exit para que atexit guarde el estado
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host="0.0.0.0", port=5000, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,271 @@
+# archive.py
+import hashlib
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+
+CHUNK_SIZE = 256 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+
+# Caché de CRC32 por (ruta, tamaño, mtime) para reanudar descargas sin
+# releer todos los ficheros anteriores más de una vez.
+crc_cache = OrderedDict()
+CRC_CACHE_SIZE = 4096
+
+
+def dos_datetime(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+# ========== Entradas del archivo ==========
+# El contenido sale de un fichero (`path`), de bytes en memoria (`data`) o de
+# un generador de trozos (`chunks`, función sin argumentos que se vuelve a
+# llamar en cada lectura) para contenido que no conviene tener entero en
+# memoria.
+class Entry:
+    def __init__(self, name, size, mtime, path=None, data=None, chunks=None):
+        self.name = name
+        self.encoded_name = name.encode("utf-8")
+        self.size = size
+        self.mtime = mtime
+        self.path = path
+        self.data = data
+        self.chunks = chunks
+        self.crc = zlib.crc32(data) if data is not None else None
+        self.offset = 0
+        self.zip64 = False
+
+    @classmethod
+    def from_file(cls, path, name=None):
+        st = os.stat(path)
+        return cls(name or os.path.basename(path), st.st_size, st.st_mtime, path=path)
+
+    @classmethod
+    def from_bytes(cls, name, data, mtime=None):
+        return cls(name, len(data), mtime or time.time(), data=data)
+
+    # Una primera pasada sobre los trozos sólo mide el tamaño y el CRC
+    @classmethod
+    def from_chunks(cls, name, chunks, mtime=None):
+        size = 0
+        crc = 0
+        for chunk in chunks():
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+        entry = cls(name, size, mtime or time.time(), chunks=chunks)
+        entry.crc = crc
+        return entry
+
+    def cache_key(self):
+        return (self.path, self.size, self.mtime)
+
+    def read(self, start=0, end=None):
+        end = self.size if end is None else end
+        if self.data is not None:
+            yield self.data[start:end]
+            return
+        if self.chunks is not None:
+            yield from self._read_chunks(start, end)
+            return
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{self.name} changed while archiving")
+                remaining -= len(chunk)
+                yield chunk
+
+    def _read_chunks(self, start, end):
+        offset = 0
+        for chunk in self.chunks():
+            chunk_end = offset + len(chunk)
+            if chunk_end > start and offset < end:
+                yield chunk[max(start - offset, 0):end - offset]
+            offset = chunk_end
+            if offset >= end:
+                return
+        # El contenido cambió entre la medida y la lectura
+        if offset != self.size:
+            raise IOError(f"{self.name} changed while archiving")
+
+    def compute_crc(self):
+        if self.crc is None:
+            key = self.cache_key()
+            crc = crc_cache.get(key)
+            if crc is None:
+                crc = 0
+                for chunk in self.read():
+                    crc = zlib.crc32(chunk, crc)
+                crc_cache[key] = crc
+                while len(crc_cache) > CRC_CACHE_SIZE:
+                    crc_cache.popitem(last=False)
+            else:
+                crc_cache.move_to_end(key)
+            self.crc = crc
+        return self.crc
+
+    def local_header(self):
+        dos_time, dos_date = dos_datetime(self.mtime)
+        # bit 3: CRC y tamaños van en el descriptor tras los datos
+        # bit 11: nombre en UTF-8
+        flags = 0x0808
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            sizes = (ZIP64_MARKER, ZIP64_MARKER)
+            version = 45
+        else:
+            extra = b""
+            sizes = (0, 0)
+            version = 20
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034b50, version, flags, 0, dos_time, dos_date,
+            0, sizes[0], sizes[1], len(self.encoded_name), len(extra)
+        ) + self.encoded_name + extra
+
+    def local_header_size(self):
+        return 30 + len(self.encoded_name) + (20 if self.zip64 else 0)
+
+    def descriptor(self):
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074b50, self.compute_crc(), self.size, self.size)
+        return struct.pack("<IIII", 0x08074b50, self.compute_crc(), self.size, self.size)
+
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def central_header(self):
+        dos_time, dos_date = dos_datetime(self.mtime)
+        if self.zip64:
+            extra = struct.pack("<HHQQQ", 0x0001, 24, self.size, self.size, self.offset)
+            size, offset, version = ZIP64_MARKER, ZIP64_MARKER, 45
+        else:
+            extra = b""
+            size, offset, version = self.size, self.offset, 20
+        return struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014b50, 0x0300 | version, version, 0x0808, 0,
+            dos_time, dos_date, self.compute_crc(), size, size,
+            len(self.encoded_name), len(extra), 0, 0, 0, 0o100644 << 16, offset
+        ) + self.encoded_name + extra
+
+    def central_header_size(self):
+        return 46 + len(self.encoded_name) + (28 if self.zip64 else 0)
+
+
+# ========== ZIP en streaming ==========
+# ZIP "stored" (sin recompresión: JPEG y MP4 ya están comprimidos) cuyo
+# tamaño total y posición de cada byte se conocen antes de leer ningún
+# fichero. Eso permite anunciar Content-Length, servir peticiones Range para
+# reanudar descargas y generar el contenido trozo a trozo con memoria
+# constante.
+class StreamingZip:
+    def __init__(self, entries):
+        self.entries = entries
+        self.segments = []
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            entry.zip64 = entry.size >= ZIP64_LIMIT or offset >= ZIP64_LIMIT
+            self.segments.append((offset, entry.local_header_size(), "header", entry))
+            offset += entry.local_header_size()
+            self.segments.append((offset, entry.size, "data", entry))
+            offset += entry.size
+            self.segments.append((offset, entry.descriptor_size(), "descriptor", entry))
+            offset += entry.descriptor_size()
+
+        self.central_offset = offset
+        self.central_size = sum(e.central_header_size() for e in entries)
+        self.zip64 = (
+            any(e.zip64 for e in entries) or len(entries) >= 0xFFFF
+            or self.central_offset >= ZIP64_LIMIT or self.central_size >= ZIP64_LIMIT
+        )
+        self.segments.append((offset, self.central_size, "central", None))
+        offset += self.central_size
+        end_size = (56 + 20 + 22) if self.zip64 else 22
+        self.segments.append((offset, end_size, "end", None))
+        self.size = offset + end_size
+
+    def etag(self):
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(entry.encoded_name)
+            digest.update(struct.pack("<Qd", entry.size, entry.mtime))
+            if entry.path is None:
+                digest.update(struct.pack("<I", entry.crc))
+        return digest.hexdigest()
+
+    def end_records(self):
+        count = len(self.entries)
+        records = b""
+        if self.zip64:
+            zip64_end_offset = self.central_offset + self.central_size
+            records += struct.pack(
+                "<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0,
+                count, count, self.central_size, self.central_offset
+            )
+            records += struct.pack("<IIQI", 0x07064b50, 0, zip64_end_offset, 1)
+            records += struct.pack(
+                "<IHHHHIIH", 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                min(self.central_size, ZIP64_MARKER), min(self.central_offset, ZIP64_MARKER), 0
+            )
+        else:
+            records += struct.pack(
+                "<IHHHHIIH", 0x06054b50, 0, 0, count, count,
+                self.central_size, self.central_offset, 0
+            )
+        return records
+
+    def _segment_bytes(self, kind, entry, start, end):
+        if kind == "data":
+            if start == 0 and end == entry.size and entry.crc is None:
+                # Lectura completa: se calcula el CRC al vuelo
+                crc = 0
+                for chunk in entry.read():
+                    crc = zlib.crc32(chunk, crc)
+                    yield chunk
+                entry.crc = crc
+            else:
+                yield from entry.read(start, end)
+            return
+        if kind == "header":
+            data = entry.local_header()
+        elif kind == "descriptor":
+            data = entry.descriptor()
+        elif kind == "central":
+            # Una cabecera central por entrada, sin construir el directorio
+            # completo en memoria
+            offset = 0
+            for e in self.entries:
+                size = e.central_header_size()
+                if offset + size > start and offset < end:
+                    header = e.central_header()
+                    yield header[max(start - offset, 0):end - offset]
+                offset += size
+            return
+        else:
+            data = self.end_records()
+        yield data[start:end]
+
+    # Genera los bytes [start, end) del archivo
+    def iter_range(self, start=0, end=None):
+        end = self.size if end is None else end
+        for seg_offset, seg_size, kind, entry in self.segments:
+            seg_end = seg_offset + seg_size
+            if seg_end <= start or seg_size == 0:
+                continue
+            if seg_offset >= end:
+                break
+            yield from self._segment_bytes(
+                kind, entry,
+                max(start, seg_offset) - seg_offset,
+                min(end, seg_end) - seg_offset
+            )
@@ -0,0 +1,136 @@
+# autofocus.py
+import threading
+import time
+import cv2
+import numpy as np
+
+# ========== Nitidez ==========
+# Sobre el plano Y del buffer lores YUV420 (los primeros width*height bytes),
+# sin convertir a BGR: recorte central de fracción `roi`, reducido por
+# `scale`. "laplacian" es la varianza del laplaciano; "tenengrad" la media
+# del cuadrado del gradiente de Sobel.
+def luma_roi(yuv_buffer, width, height, roi=0.5, scale=0.5):
+    luma = np.frombuffer(yuv_buffer, dtype=np.uint8)[:width * height].reshape(height, width)
+    rw, rh = max(int(width * roi), 8), max(int(height * roi), 8)
+    x0, y0 = (width - rw) // 2, (height - rh) // 2
+    crop = luma[y0:y0 + rh, x0:x0 + rw]
+    if scale < 1.0:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return crop
+
+
+def sharpness(gray, metric="laplacian"):
+    if metric == "tenengrad":
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        return float(cv2.mean(gx * gx + gy * gy)[0])
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S, ksize=3))
+    return float(std[0][0] ** 2)
+
+
+# ========== Autoenfoque ==========
+# Barrido grueso de [lo, hi] en `coarse` intervalos y refinamiento alrededor
+# del mejor punto con paso mitad hasta `min_step`. En cada posición se espera
+# `settle` s, se descarta un frame (pudo exponerse durante el movimiento) y
+# se promedia la nitidez de `frames` frames. move_to(posición) mueve el motor
+# y bloquea; measure() devuelve la nitidez de un frame nuevo.
+class Autofocus:
+    def __init__(self, move_to, measure, log):
+        self.move_to = move_to
+        self.measure = measure
+        self.log = log
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.state = {"status": "idle", "curve": [], "best": None, "started": None, "finished": None, "error": None}
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, lo, hi, coarse=8, min_step=1, settle=0.1, frames=2):
+        with self.lock:
+            if self.running():
+                return False
+            self.stop_event.clear()
+            self.state = {
+                "status": "running",
+                "range": [lo, hi],
+                "curve": [],
+                "best": None,
+                "started": time.time(),
+                "finished": None,
+                "error": None
+            }
+            self.thread = threading.Thread(
+                target=self._run, args=(lo, hi, coarse, min_step, settle, frames),
+                name="autofocus", daemon=True
+            )
+            self.thread.start()
+        return True
+
+    def stop(self):
+        if not self.running():
+            return False
+        self.stop_event.set()
+        return True
+
+    def _score(self, position, settle, frames, scores):
+        if position in scores:
+            return scores[position]
+        if self.stop_event.is_set():
+            raise InterruptedError()
+        self.move_to(position)
+        if self.stop_event.wait(settle):
+            raise InterruptedError()
+        self.measure()
+        score = sum(self.measure() for _ in range(frames)) / frames
+        scores[position] = score
+        with self.lock:
+            self.state["curve"].append({"step": position, "score": round(score, 3)})
+        return score
+
+    def _run(self, lo, hi, coarse, min_step, settle, frames):
+        self.log(f"Autofocus started: steps {lo}..{hi}")
+        scores = {}
+        try:
+            step = max((hi - lo) // max(coarse, 1), min_step, 1)
+            positions = list(range(lo, hi + 1, step))
+            if positions[-1] != hi:
+                positions.append(hi)
+            for position in positions:
+                self._score(position, settle, frames, scores)
+            best = max(scores, key=scores.get)
+            while step > min_step:
+                step = max(step // 2, min_step)
+                for position in (best - step, best + step):
+                    if lo <= position <= hi:
+                        self._score(position, settle, frames, scores)
+                best = max(scores, key=scores.get)
+            self.move_to(best)
+            status = "done"
+        except InterruptedError:
+            best = max(scores, key=scores.get) if scores else None
+            status = "stopped"
+        except Exception as e:
+            best = None
+            status = "error"
+            with self.lock:
+                self.state["error"] = str(e)
+            self.log(f"Autofocus error: {e}")
+
+        with self.lock:
+            self.state["status"] = status
+            self.state["best"] = best
+            self.state["finished"] = time.time()
+            elapsed = self.state["finished"] - self.state["started"]
+            count = len(self.state["curve"])
+        if status == "done":
+            self.log(f"Autofocus done: best step {best} ({count} positions, {elapsed:.1f}s)")
+        elif status == "stopped":
+            self.log("Autofocus stopped")
+
+    def status(self):
+        with self.lock:
+            state = dict(self.state)
+            state["curve"] = sorted(state["curve"], key=lambda p: p["step"])
+        return state
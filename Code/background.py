@@ -0,0 +1,83 @@
+# background.py
+import threading
+import cv2
+import numpy as np
+
+# ========== Modelo de fondo (flat-field) ==========
+# Fondo de la celda de flujo a partir de los últimos frames en gris: polvo,
+# rayas y gradientes de iluminación quedan en el fondo porque no se mueven,
+# las partículas sí. "median" guarda un anillo de `frames` imágenes y
+# recalcula la mediana cada `refresh` actualizaciones (coste amortizado);
+# "mean" es una media exponencial con peso `alpha`, una sola pasada por frame.
+class BackgroundModel:
+    def __init__(self, method="median", frames=8, refresh=4, min_frames=3, alpha=0.1):
+        self.lock = threading.Lock()
+        self.method = method
+        self.frames = frames
+        self.refresh = max(1, refresh)
+        self.min_frames = min_frames
+        self.alpha = alpha
+        self._clear(None)
+
+    def _clear(self, shape):
+        self.shape = shape
+        self.ring = None
+        self.mean = None
+        self.count = 0
+        self.index = 0
+        self.updates = 0
+        self.background = None
+
+    def reset(self):
+        with self.lock:
+            self._clear(None)
+
+    def update(self, bgr_frame):
+        gray = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2GRAY)
+        with self.lock:
+            if gray.shape != self.shape:
+                self._clear(gray.shape)
+            self.updates += 1
+            self.count = min(self.count + 1, self.frames)
+            if self.method == "mean":
+                if self.mean is None:
+                    self.mean = gray.astype(np.float32)
+                else:
+                    cv2.accumulateWeighted(gray, self.mean, self.alpha)
+                self.background = None
+                return
+            if self.ring is None:
+                self.ring = np.empty((self.frames,) + gray.shape, dtype=np.uint8)
+            self.ring[self.index] = gray
+            self.index = (self.index + 1) % self.frames
+            if self.background is None or self.updates % self.refresh == 0:
+                self.background = self._median()
+
+    # Mediana por bloques de filas para no crear temporales del tamaño del anillo
+    def _median(self):
+        stack = self.ring[:self.count]
+        out = np.empty(self.shape, dtype=np.uint8)
+        rows = max(1, 262144 // self.shape[1])
+        for y in range(0, self.shape[0], rows):
+            out[y:y + rows] = np.median(stack[:, y:y + rows], axis=0)
+        return out
+
+    # Fondo actual (uint8) o None mientras no haya frames suficientes
+    def snapshot(self):
+        with self.lock:
+            if self.count < self.min_frames:
+                return None
+            if self.method == "mean":
+                if self.background is None:
+                    self.background = cv2.convertScaleAbs(self.mean)
+            return self.background
+
+    def status(self):
+        with self.lock:
+            return {
+                "method": self.method,
+                "frames": self.count,
+                "ready": self.count >= self.min_frames,
+                "shape": list(self.shape) if self.shape else None
+            }
+
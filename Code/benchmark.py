@@ -0,0 +1,225 @@
+# benchmark.py
+# Reproduce el corpus de samples/ (JPEG y frames de los vídeos) a través de la
+# segmentación, sin cámara. Uso:
+#   python benchmark.py                         # informe
+#   python benchmark.py --save-baseline         # guarda la referencia
+#   python benchmark.py --check --tolerance 0.2 # falla si fps cae > 20 %
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from functools import partial
+from background import BackgroundModel
+from segmentation import STAGES, segment_background, segment_objects, segment_tiled
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SAMPLES = os.path.join(BASE_DIR, "samples")
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+VIDEO_EXTENSIONS = ('.mp4', '.h264')
+
+
+# ========== Corpus ==========
+def iter_video_frames(path, max_frames, step):
+    cap = cv2.VideoCapture(path)
+    try:
+        index = 0
+        taken = 0
+        while taken < max_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if index % step == 0:
+                taken += 1
+                yield frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def load_corpus(samples_dir, video_frames, video_step):
+    frames = []
+    for name in sorted(os.listdir(samples_dir)):
+        path = os.path.join(samples_dir, name)
+        lower = name.lower()
+        if lower.endswith(('.jpg', '.jpeg')) and "_annotated" not in lower:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append((name, frame))
+        elif lower.endswith(VIDEO_EXTENSIONS) and video_frames > 0:
+            for i, frame in enumerate(iter_video_frames(path, video_frames, video_step)):
+                frames.append((f"{name}#{i}", frame))
+    return frames
+
+
+# Un modelo de fondo por tamaño de frame, alimentado con todo el corpus antes
+# de medir: sólo se cronometra la segmentación por sustracción. Con
+# `min_area` (al medir por teselas) el umbral de área es absoluto, como hace
+# processing.segment con fondo y teselas.
+def background_segmenter(frames, method, threshold, min_area=None):
+    models = {}
+    for _, frame in frames:
+        shape = frame.shape[:2]
+        if shape not in models:
+            models[shape] = BackgroundModel(method=method, frames=8, refresh=8, min_frames=1)
+        models[shape].update(frame)
+
+    def segment(frame, timings=None):
+        background = models[frame.shape[:2]].snapshot()
+        return segment_background(frame, background, threshold, min_area=min_area, timings=timings)
+    return segment
+
+
+# ========== Medida ==========
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "mean": 0.0}
+    arr = np.asarray(values) * 1000.0
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {"p50": round(float(p50), 3), "p90": round(float(p90), 3), "p99": round(float(p99), 3), "mean": round(float(arr.mean()), 3)}
+
+
+def run_benchmark(frames, repeat, warmup, segment=segment_objects):
+    for _, frame in frames[:warmup]:
+        segment(frame)
+
+    stage_samples = {stage: [] for stage in STAGES}
+    totals = []
+    objects = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, frame in frames:
+            timings = {}
+            t0 = time.perf_counter()
+            objects += len(segment(frame, timings=timings))
+            totals.append(time.perf_counter() - t0)
+            for stage in STAGES:
+                stage_samples[stage].append(timings.get(stage, 0.0))
+    elapsed = time.perf_counter() - started
+    peak_traced = trace_memory(frames, segment)
+
+    count = len(totals)
+    return {
+        "frames": count,
+        "objects": objects,
+        "elapsed": round(elapsed, 3),
+        "frames_per_second": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "objects_per_second": round(objects / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles(totals),
+        "stages_ms": {stage: percentiles(values) for stage, values in stage_samples.items()},
+        # tracemalloc sólo ve asignaciones de Python/NumPy; ru_maxrss incluye OpenCV
+        "peak_traced_mb": round(peak_traced / 1e6, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 2)
+    }
+
+
+# Pasada aparte sin cronometrar: tracemalloc intercepta cada asignación y
+# falsearía los tiempos
+def trace_memory(frames, segment):
+    tracemalloc.start()
+    try:
+        for _, frame in frames:
+            segment(frame)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Opciones que cambian lo que se mide: una referencia sólo vale para las mismas
+def benchmark_options(args, frames):
+    return {
+        "corpus_frames": len(frames),
+        "video_frames": args.video_frames,
+        "video_step": args.video_step,
+        "tile_size": args.tile_size,
+        "tile_overlap": args.tile_overlap if args.tile_size > 0 else None,
+        "tile_workers": args.tile_workers if args.tile_size > 0 else None,
+        "min_area": args.min_area if args.tile_size > 0 else None,
+        "background": args.background,
+        "threshold": args.threshold if args.background else None
+    }
+
+
+def print_report(result):
+    print(f"Frames: {result['frames']}  Objects: {result['objects']}  Time: {result['elapsed']} s")
+    print(f"Throughput: {result['frames_per_second']} frames/s, {result['objects_per_second']} objects/s")
+    print(f"Peak memory: {result['peak_rss_mb']} MB RSS, {result['peak_traced_mb']} MB traced")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    rows = list(result["stages_ms"].items()) + [("total", result["latency_ms"])]
+    for stage, p in rows:
+        print(f"{stage:<12}{p['p50']:>10}{p['p90']:>10}{p['p99']:>10}{p['mean']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segmentation benchmark over the samples/ corpus")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES)
+    parser.add_argument("--video-frames", type=int, default=20, help="frames decoded per video (0 = skip videos)")
+    parser.add_argument("--video-step", type=int, default=5, help="keep one frame out of N")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--tile-size", type=int, default=0, help="segment in tiles of N pixels (0 = whole frame)")
+    parser.add_argument("--tile-overlap", type=int, default=64)
+    parser.add_argument("--tile-workers", type=int, default=4)
+    parser.add_argument("--min-area", type=int, default=100, help="minimum object area in pixels when tiling")
+    parser.add_argument("--background", choices=["median", "mean"], help="segment by background subtraction")
+    parser.add_argument("--threshold", type=float, default=0.15, help="background subtraction threshold")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="fail if throughput regressed versus the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed throughput drop (fraction)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    frames = load_corpus(args.samples, args.video_frames, args.video_step)
+    if not frames:
+        print(f"No frames found in {args.samples}", file=sys.stderr)
+        return 2
+
+    segment = segment_objects
+    if args.background:
+        # Con fondo no hay teselas (como en processing.segment): --tile-size
+        # sólo aporta el área mínima absoluta
+        min_area = args.min_area if args.tile_size > 0 else None
+        segment = background_segmenter(frames, args.background, args.threshold, min_area)
+    elif args.tile_size > 0:
+        segment = partial(segment_tiled, tile_size=args.tile_size, overlap=args.tile_overlap,
+                          workers=args.tile_workers, min_area=args.min_area)
+    result = run_benchmark(frames, args.repeat, args.warmup, segment)
+    result["options"] = benchmark_options(args, frames)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved: {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}", file=sys.stderr)
+            return 2
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("options") != result["options"]:
+            print(f"Baseline was recorded with different options: {baseline.get('options')}", file=sys.stderr)
+            print(f"Current options: {result['options']} (re-record with --save-baseline)", file=sys.stderr)
+            return 2
+        reference = baseline["frames_per_second"]
+        floor = reference * (1.0 - args.tolerance)
+        current = result["frames_per_second"]
+        change = (current - reference) / reference * 100 if reference else 0.0
+        print(f"Throughput {current} frames/s vs baseline {reference} frames/s ({change:+.1f}%)")
+        if current < floor:
+            print(f"REGRESSION: below {floor:.2f} frames/s (tolerance {args.tolerance:.0%})", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
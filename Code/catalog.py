@@ -0,0 +1,198 @@
+# catalog.py
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+SAMPLE_EXTENSIONS = ('.jpg', '.jpeg', '.mp4', '.txt', '.csv', '.zip')
+
+
+def sample_type(filename):
+    name = filename.lower()
+    if name.endswith(('.jpg', '.jpeg')):
+        return "photo"
+    if name.endswith('.mp4'):
+        return "video"
+    return "data"
+
+
+def is_sample(filename):
+    return filename.lower().endswith(SAMPLE_EXTENSIONS)
+
+
+def format_time(mtime):
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Acepta "YYYY-MM-DD" o una fecha/hora ISO; con sólo fecha y end=True
+# devuelve el final de ese día (exclusivo).
+def parse_time(value, end=False):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
+
+# ========== Catálogo de muestras ==========
+# Índice SQLite de SAMPLES_DIR: se actualiza en cada captura/borrado y se
+# reconcilia con el directorio al arrancar, para que listar muestras no
+# requiera recorrer el directorio ni hacer un stat por fichero.
+class Catalog:
+    def __init__(self, db_path, samples_dir):
+        self.samples_dir = samples_dir
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS samples_mtime ON samples (mtime DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS samples_type ON samples (type, mtime DESC);
+            CREATE TABLE IF NOT EXISTS objects (
+                sample_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+                label TEXT,
+                confidence REAL,
+                PRIMARY KEY (sample_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS objects_label ON objects (label, sample_id);
+        """)
+        self.db.commit()
+
+    def reconcile(self):
+        on_disk = {}
+        with os.scandir(self.samples_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and is_sample(entry.name):
+                    st = entry.stat()
+                    on_disk[entry.name] = (st.st_mtime, st.st_size)
+
+        with self.lock:
+            known = {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT id, mtime, size FROM samples")}
+            stale = [(name,) for name in known if name not in on_disk]
+            changed = [
+                (name, sample_type(name), mtime, size)
+                for name, (mtime, size) in on_disk.items()
+                if known.get(name) != (mtime, size)
+            ]
+            with self.db:
+                self.db.executemany("DELETE FROM samples WHERE id = ?", stale)
+                self.db.executemany("DELETE FROM objects WHERE sample_id = ?", stale)
+                self.db.executemany("INSERT OR REPLACE INTO samples (id, type, mtime, size) VALUES (?, ?, ?, ?)", changed)
+        return len(changed), len(stale)
+
+    def add(self, filename, objects=None):
+        path = os.path.join(self.samples_dir, filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO samples (id, type, mtime, size) VALUES (?, ?, ?, ?)",
+                (filename, sample_type(filename), st.st_mtime, st.st_size)
+            )
+            if objects is not None:
+                self.db.execute("DELETE FROM objects WHERE sample_id = ?", (filename,))
+                self.db.executemany(
+                    "INSERT INTO objects (sample_id, idx, x, y, w, h, label, confidence) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(filename, i, o["x"], o["y"], o["w"], o["h"], o["label"], o["confidence"]) for i, o in enumerate(objects)]
+                )
+        return True
+
+    def remove(self, filename):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM samples WHERE id = ?", (filename,))
+            self.db.execute("DELETE FROM objects WHERE sample_id = ?", (filename,))
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM samples")
+            self.db.execute("DELETE FROM objects")
+
+    # Paginación por cursor (keyset) sobre (mtime, id) en orden descendente.
+    # El cursor es opaco para el cliente: "<mtime>:<id>" del último elemento.
+    def query(self, type=None, since=None, until=None, label=None, cursor=None, limit=100):
+        where = []
+        args = []
+        if type:
+            where.append("s.type = ?")
+            args.append(type)
+        if since is not None:
+            where.append("s.mtime >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("s.mtime < ?")
+            args.append(until)
+        if label:
+            where.append("EXISTS (SELECT 1 FROM objects o WHERE o.sample_id = s.id AND o.label = ?)")
+            args.append(label)
+        if cursor:
+            mtime, _, last_id = cursor.partition(":")
+            where.append("(s.mtime < ? OR (s.mtime = ? AND s.id < ?))")
+            args.extend([float(mtime), float(mtime), last_id])
+
+        sql = "SELECT s.id, s.type, s.mtime, s.size FROM samples s"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY s.mtime DESC, s.id DESC LIMIT ?"
+        args.append(limit + 1)
+
+        with self.lock:
+            rows = self.db.execute(sql, args).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][2]!r}:{rows[-1][0]}"
+        items = [
+            {"id": name, "time": format_time(mtime), "mtime": mtime, "type": kind, "size": size}
+            for name, kind, mtime, size in rows
+        ]
+        return items, next_cursor
+
+    def query_all(self, page_size=1000, **filters):
+        files = []
+        cursor = None
+        while True:
+            items, cursor = self.query(cursor=cursor, limit=page_size, **filters)
+            files.extend(items)
+            if cursor is None:
+                return files
+
+    def objects(self, sample_ids):
+        for i in range(0, len(sample_ids), 500):
+            chunk = sample_ids[i:i+500]
+            marks = ",".join("?" * len(chunk))
+            with self.lock:
+                rows = self.db.execute(
+                    f"SELECT sample_id, idx, x, y, w, h, label, confidence FROM objects "
+                    f"WHERE sample_id IN ({marks}) ORDER BY sample_id, idx", chunk
+                ).fetchall()
+            yield from rows
+
+    def labels(self, sample_ids):
+        if not sample_ids:
+            return {}
+        result = {}
+        with self.lock:
+            for i in range(0, len(sample_ids), 500):
+                chunk = sample_ids[i:i+500]
+                marks = ",".join("?" * len(chunk))
+                for sample_id, label in self.db.execute(
+                    f"SELECT DISTINCT sample_id, label FROM objects WHERE sample_id IN ({marks})", chunk
+                ):
+                    result.setdefault(sample_id, []).append(label)
+        return result
@@ -0,0 +1,265 @@
+# classification.py
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import cv2
+
+# ========== Clasificador de plancton ==========
+try:
+    import ml.classifier as ml_classifier
+    from ml.classifier import classify_image
+    CLASSIFIER_AVAILABLE = True
+    print("✅ Plankton classifier loaded")
+except Exception as e:
+    ml_classifier = None
+    classify_image = None
+    CLASSIFIER_AVAILABLE = False
+    print(f"❌ Classifier error: {e}")
+
+# El clasificador puede exponer una API por lotes sobre arrays
+# (classify_batch) o por array individual (classify_array); si no, se usa el
+# camino clásico de un JPEG temporal por objeto.
+native_classify_batch = getattr(ml_classifier, "classify_batch", None)
+native_classify_array = getattr(ml_classifier, "classify_array", None)
+
+UNKNOWN_RESULT = {"label": "unknown", "confidence": 0.0}
+
+# Versión del modelo, para no reutilizar resultados de otro modelo
+MODEL_VERSION = str(
+    getattr(ml_classifier, "MODEL_VERSION", None)
+    or getattr(ml_classifier, "__version__", None)
+    or "default"
+)
+
+
+def error_result(e):
+    return {"label": "error", "confidence": 0.0, "error": str(e)}
+
+
+def classify_crop_file(crop, tmp_dir=None):
+    fd, obj_path = tempfile.mkstemp(prefix="temp_obj_", suffix=".jpg", dir=tmp_dir)
+    os.close(fd)
+    try:
+        cv2.imwrite(obj_path, crop)
+        return classify_image(obj_path)
+    finally:
+        os.remove(obj_path)
+
+
+def classify_one(crop, tmp_dir=None):
+    try:
+        if native_classify_array is not None:
+            return native_classify_array(crop)
+        return classify_crop_file(crop, tmp_dir)
+    except Exception as e:
+        return error_result(e)
+
+
+# ========== Caché de resultados ==========
+# En flujo continuo el mismo organismo (o una partícula pegada a la celda)
+# aparece frame tras frame. Cada recorte se resume en un dHash de 64 bits
+# (gris reducido a 9x8, signo del gradiente horizontal) más un cubo de
+# tamaño, para no confundir objetos de forma parecida y distinto tamaño. Un
+# recorte a `threshold` bits o menos de uno ya clasificado reutiliza su
+# etiqueta y confianza. LRU de `size` entradas que caducan a los `ttl` s.
+def dhash(crop):
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def size_bucket(crop):
+    return max(crop.shape[0] * crop.shape[1], 1).bit_length()
+
+
+# Los vecinos a `threshold` bits se buscan en un índice por bandas: el hash
+# se parte en threshold + 1 bandas y, por el principio del palomar, dos hashes
+# a esa distancia o menos coinciden al menos en una banda entera. Cada
+# búsqueda sólo compara con las entradas que comparten alguna banda, no con
+# toda la caché.
+class ResultCache:
+    def __init__(self, size=512, ttl=60.0, threshold=4):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.index = {}
+        self.size = size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, size, ttl, threshold):
+        with self.lock:
+            self.size = size
+            self.ttl = ttl
+            if threshold != self.threshold:
+                self.threshold = threshold
+                self.index = {}
+                for key in self.entries:
+                    self._index(key)
+            while len(self.entries) > max(size, 0):
+                self._evict()
+
+    def key(self, crop):
+        return (MODEL_VERSION, size_bucket(crop), dhash(crop))
+
+    def similar(self, a, b):
+        return a[:2] == b[:2] and (a[2] ^ b[2]).bit_count() <= self.threshold
+
+    def _bands(self, key):
+        version, bucket, value = key
+        count = min(max(self.threshold, 0) + 1, 64)
+        width = 64 // count
+        for band in range(count):
+            low = band * width
+            bits = 64 - low if band == count - 1 else width
+            yield (version, bucket, band, (value >> low) & ((1 << bits) - 1))
+
+    def _index(self, key):
+        for band in self._bands(key):
+            self.index.setdefault(band, set()).add(key)
+
+    def _unindex(self, key):
+        for band in self._bands(key):
+            keys = self.index.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[band]
+
+    def _evict(self):
+        key, _ = self.entries.popitem(last=False)
+        self._unindex(key)
+
+    def _nearest(self, key):
+        for band in self._bands(key):
+            for other in self.index.get(band, ()):
+                if self.similar(other, key):
+                    return other
+        return None
+
+    # Sin contar aciertos ni fallos: los cuenta classify_batch con record()
+    def lookup(self, key, now):
+        with self.lock:
+            if key not in self.entries and self.threshold > 0:
+                key = self._nearest(key) or key
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self.entries[key]
+                self._unindex(key)
+                entry = None
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return dict(entry[1])
+
+    def store(self, key, result, now):
+        if "error" in result or self.size <= 0:
+            return
+        with self.lock:
+            if key not in self.entries:
+                self._index(key)
+            self.entries[key] = (now, dict(result))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self._evict()
+
+    def record(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+# Una caché por proceso del pool: cada trabajo devuelve sus aciertos y
+# fallos y el proceso principal los acumula en CacheStats
+result_cache = ResultCache()
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, counts):
+        if not counts:
+            return
+        with self.lock:
+            self.hits += counts.get("hits", 0)
+            self.misses += counts.get("misses", 0)
+
+    def snapshot(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Clasifica una lista de recortes BGR (pueden ser vistas del frame original,
+# no se modifican) y devuelve un resultado por recorte, en el mismo orden.
+# Con `cache` sólo se envían al clasificador los recortes sin resultado previo,
+# y de los que se parecen entre sí dentro del lote (la misma clave o a
+# `threshold` bits) sólo el primero: su resultado se reparte al resto, que
+# cuentan como aciertos.
+def classify_batch(crops, tmp_dir=None, cache=None):
+    if not crops:
+        return []
+    if not CLASSIFIER_AVAILABLE:
+        return [dict(UNKNOWN_RESULT) for _ in crops]
+    if cache is None:
+        return classify_uncached(crops, tmp_dir)
+
+    now = time.monotonic()
+    keys = [cache.key(crop) for crop in crops]
+    results = [cache.lookup(key, now) for key in keys]
+    groups = OrderedDict()
+    for i, result in enumerate(results):
+        if result is None:
+            first = next((j for j in groups if cache.similar(keys[j], keys[i])), i)
+            groups.setdefault(first, []).append(i)
+    if groups:
+        fresh = classify_uncached([crops[i] for i in groups], tmp_dir)
+        for (first, members), result in zip(groups.items(), fresh):
+            cache.store(keys[first], result, now)
+            for i in members:
+                results[i] = dict(result)
+    cache.record(len(crops) - len(groups), len(groups))
+    return results
+
+
+# Un fallo de la API por lotes se avisa una vez por proceso: si no, un
+# modelo roto parecería sólo lento (cae al camino por objeto)
+native_batch_warned = False
+
+
+def warn_native_batch(message):
+    global native_batch_warned
+    if native_batch_warned:
+        return
+    native_batch_warned = True
+    print(f"⚠️ Classifier classify_batch failed, falling back to one crop at a time: {message}")
+
+
+def classify_uncached(crops, tmp_dir=None):
+    if native_classify_batch is not None:
+        try:
+            results = list(native_classify_batch(crops))
+            if len(results) == len(crops):
+                return results
+            warn_native_batch(f"{len(results)} results for {len(crops)} crops")
+        except Exception as e:
+            warn_native_batch(repr(e))
+
+    return [classify_one(crop, tmp_dir) for crop in crops]
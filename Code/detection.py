@@ -0,0 +1,171 @@
+# detection.py
+import json
+import threading
+import time
+import cv2
+import numpy as np
+from segmentation import StageTimer, threshold_mask
+
+# ========== Detección en vivo ==========
+# Detección ligera para la superposición de la preview. El hilo del stream
+# sólo deja el frame lores en una ranura (feed); un hilo propio toma uno de
+# cada `every` frames, lo reduce por `scale` y lo umbraliza como las fotos,
+# sin morfometría ni clasificación. Entre detecciones las cajas se mueven con
+# la velocidad estimada de cada pista, así que la superposición se publica
+# en cada frame aunque la detección vaya más lenta que el stream.
+class Track:
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.vx = 0.0
+        self.vy = 0.0
+        self.seen = now
+        self.hits = 1
+
+    def center(self):
+        x, y, w, h = self.box
+        return x + w / 2, y + h / 2
+
+    def predict(self, now):
+        x, y, w, h = self.box
+        dt = now - self.seen
+        return x + self.vx * dt, y + self.vy * dt, w, h
+
+    def update(self, box, now):
+        dt = now - self.seen
+        if dt > 0:
+            (cx, cy), (nx, ny) = self.center(), (box[0] + box[2] / 2, box[1] + box[3] / 2)
+            # Velocidad suavizada para que una detección ruidosa no dispare la caja
+            self.vx = 0.5 * self.vx + 0.5 * (nx - cx) / dt
+            self.vy = 0.5 * self.vy + 0.5 * (ny - cy) / dt
+        self.box = box
+        self.seen = now
+        self.hits += 1
+
+
+class LiveDetector:
+    def __init__(self, every=3, scale=0.5, min_area_frac=0.0005, max_area_frac=0.01, max_age=0.5):
+        self.every = max(1, every)
+        self.scale = scale
+        self.min_area_frac = min_area_frac
+        self.max_area_frac = max_area_frac
+        self.max_age = max_age
+        self.cond = threading.Condition()
+        self.pending = None
+        self.fed = 0
+        self.tracks = []
+        self.next_id = 1
+        self.size = None
+        self.seq = 0
+        self.overlay = {"seq": 0, "time": 0.0, "size": None, "objects": []}
+        self.detect_ms = 0.0
+        self.thread = None
+
+    # Llamado desde el productor del stream: nunca bloquea por la detección
+    def feed(self, bgr_frame):
+        now = time.monotonic()
+        with self.cond:
+            self.fed += 1
+            self.size = (bgr_frame.shape[1], bgr_frame.shape[0])
+            if self.fed % self.every == 0:
+                self.pending = (bgr_frame, now)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="live-detector", daemon=True)
+                    self.thread.start()
+            self._publish(now)
+            self.cond.notify_all()
+
+    def clear(self):
+        with self.cond:
+            self.pending = None
+            self.tracks = []
+            self._publish(time.monotonic())
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None)
+                frame, captured = self.pending
+                self.pending = None
+            started = time.perf_counter()
+            boxes = self.detect(frame)
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with self.cond:
+                self.detect_ms = 0.9 * self.detect_ms + 0.1 * elapsed if self.detect_ms else elapsed
+                self._match(boxes, captured)
+
+    def detect(self, bgr_frame):
+        small = cv2.resize(bgr_frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        mask = threshold_mask(gray, StageTimer(None))
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        H, W = gray.shape
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        keep = np.flatnonzero((areas >= self.min_area_frac * H * W) & (areas <= self.max_area_frac * H * W)) + 1
+        inv = 1.0 / self.scale
+        return [tuple(float(v) * inv for v in stats[i, :4]) for i in keep]
+
+    # Emparejamiento voraz por distancia entre centros, de la pareja más
+    # cercana a la más lejana, con una puerta proporcional al tamaño
+    def _match(self, boxes, now):
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            px, py, pw, ph = track.predict(now)
+            pcx, pcy = px + pw / 2, py + ph / 2
+            gate = max(pw, ph) * 1.5 + 10
+            for bi, (x, y, w, h) in enumerate(boxes):
+                d = ((x + w / 2 - pcx) ** 2 + (y + h / 2 - pcy) ** 2) ** 0.5
+                if d <= gate:
+                    pairs.append((d, ti, bi))
+        pairs.sort()
+        used_tracks = set()
+        used_boxes = set()
+        for _, ti, bi in pairs:
+            if ti in used_tracks or bi in used_boxes:
+                continue
+            used_tracks.add(ti)
+            used_boxes.add(bi)
+            self.tracks[ti].update(boxes[bi], now)
+        for bi, box in enumerate(boxes):
+            if bi not in used_boxes:
+                self.tracks.append(Track(self.next_id, box, now))
+                self.next_id += 1
+        self.tracks = [t for t in self.tracks if now - t.seen <= self.max_age]
+
+    def _publish(self, now):
+        objects = []
+        for track in self.tracks:
+            if now - track.seen > self.max_age:
+                continue
+            x, y, w, h = track.predict(now)
+            objects.append({"id": track.id, "x": int(x), "y": int(y), "w": int(w), "h": int(h)})
+        self.seq += 1
+        self.overlay = {
+            "seq": self.seq,
+            "time": time.time(),
+            "size": self.size,
+            "objects": objects
+        }
+
+    def snapshot(self):
+        with self.cond:
+            return dict(self.overlay, detect_ms=round(self.detect_ms, 2))
+
+    # Superposición como Server-Sent Events, como mucho `max_fps` por segundo
+    def sse(self, max_fps=20.0, keepalive=15.0):
+        last_seq = -1
+        min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        while True:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.seq != last_seq, timeout=keepalive):
+                    overlay = None
+                else:
+                    overlay = self.overlay
+                    last_seq = self.seq
+            if overlay is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {json.dumps(overlay)}\n\n"
+            if min_interval:
+                time.sleep(min_interval)
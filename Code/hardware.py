@@ -0,0 +1,296 @@
+# hardware.py
+import os
+import threading
+import time
+
+# ========== Backends de GPIO ==========
+# El motor de pasos y el resto de la aplicación escriben los pines a través
+# de un backend con la misma interfaz mínima: setup_output(), write() y
+# cleanup(). Así el motor se puede probar sin Raspberry Pi.
+
+class RPiGPIOBackend:
+    def __init__(self, gpio):
+        self.gpio = gpio
+
+    def setup_output(self, pin):
+        self.gpio.setup(pin, self.gpio.OUT)
+
+    def write(self, pin, level):
+        self.gpio.output(pin, self.gpio.HIGH if level else self.gpio.LOW)
+
+    def cleanup(self):
+        self.gpio.cleanup()
+
+
+# Sustituto de RPi.GPIO con la misma API que usa app.py. Registra cada
+# flanco como (timestamp, pin, nivel) para comprobar temporizaciones y
+# perfiles de aceleración.
+class FakeGPIO:
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, max_events=100000):
+        self.lock = threading.Lock()
+        self.mode = None
+        self.levels = {}
+        self.events = []
+        self.max_events = max_events
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, initial=None):
+        with self.lock:
+            self.levels.setdefault(pin, bool(initial))
+
+    def output(self, pin, value):
+        now = time.perf_counter()
+        level = bool(value)
+        with self.lock:
+            if self.levels.get(pin) == level:
+                return
+            self.levels[pin] = level
+            if len(self.events) < self.max_events:
+                self.events.append((now, pin, level))
+
+    def input(self, pin):
+        with self.lock:
+            return self.HIGH if self.levels.get(pin) else self.LOW
+
+    def cleanup(self, *args):
+        with self.lock:
+            self.levels.clear()
+
+    def edges(self, pin, level=True):
+        with self.lock:
+            return [t for t, p, v in self.events if p == pin and v == level]
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+
+
+class FakeGPIOBackend(RPiGPIOBackend):
+    def __init__(self, max_events=100000):
+        super().__init__(FakeGPIO(max_events))
+
+    def edges(self, pin, level=True):
+        return self.gpio.edges(pin, level)
+
+    def clear(self):
+        self.gpio.clear()
+
+
+# PLANKTOSCOPE_HARDWARE: "pi" exige el hardware real, "sim" fuerza los
+# sustitutos y "auto" (por defecto) usa los sustitutos si falta algún módulo.
+def hardware_mode():
+    return os.environ.get("PLANKTOSCOPE_HARDWARE", "auto").lower()
+
+
+def load_gpio(mode=None):
+    mode = mode or hardware_mode()
+    if mode != "sim":
+        try:
+            import RPi.GPIO as GPIO
+            return GPIO, False
+        except (ImportError, RuntimeError):
+            if mode == "pi":
+                raise
+    print("⚠️ RPi.GPIO not available, using simulated GPIO")
+    return FakeGPIO(), True
+
+
+# ========== Cámara simulada ==========
+# Reproduce en bucle los vídeos grabados en samples/ al ritmo configurado y
+# ofrece la parte de la API de Picamera2 que usa la aplicación.
+class SimulatedCamera:
+    def __init__(self, source, fps=30.0, main_size=(1280, 960)):
+        self.sources = self._find_sources(source)
+        self.fps = fps
+        self.main_size = tuple(main_size)
+        self.lores_size = (640, 480)
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.frame = None
+        self.running = False
+        self.thread = None
+        self.recorders = {}
+
+    def _find_sources(self, source):
+        if os.path.isdir(source):
+            names = sorted(os.listdir(source))
+            return [os.path.join(source, n) for n in names if n.lower().endswith(('.mp4', '.h264', '.avi', '.mkv'))]
+        return [source]
+
+    def create_preview_configuration(self, main=None, lores=None, **kwargs):
+        return {"main": main or {}, "lores": lores or {}}
+
+    create_video_configuration = create_preview_configuration
+    create_still_configuration = create_preview_configuration
+
+    def configure(self, config):
+        if config.get("main", {}).get("size"):
+            self.main_size = tuple(config["main"]["size"])
+        if config.get("lores", {}).get("size"):
+            self.lores_size = tuple(config["lores"]["size"])
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="simulated-camera", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def close(self):
+        self.stop()
+
+    def _frames(self):
+        import cv2
+        import numpy as np
+        while self.running:
+            produced = False
+            for path in self.sources:
+                cap = cv2.VideoCapture(path)
+                while self.running:
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    produced = True
+                    yield frame
+                cap.release()
+            if not produced:
+                # Sin vídeos: patrón sintético con partículas en movimiento
+                frame = np.full((self.main_size[1], self.main_size[0], 3), 200, dtype=np.uint8)
+                t = time.time()
+                for i in range(12):
+                    x = int((i * 97 + t * 40 * (1 + i % 3)) % self.main_size[0])
+                    y = int((i * 53 + t * 25) % self.main_size[1])
+                    cv2.circle(frame, (x, y), 6 + i % 5, (60, 70, 80), -1)
+                yield frame
+
+    def _run(self):
+        import cv2
+        interval = 1.0 / self.fps
+        deadline = time.perf_counter()
+        for frame in self._frames():
+            lores = cv2.resize(frame, self.lores_size, interpolation=cv2.INTER_AREA)
+            yuv = cv2.cvtColor(lores, cv2.COLOR_BGR2YUV_I420)
+            with self.cond:
+                self.frame = (frame, yuv)
+                self.seq += 1
+                self.cond.notify_all()
+            for recorder in list(self.recorders.values()):
+                recorder.write(lores if recorder.stream == "lores" else self._main(frame))
+            deadline += interval
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.perf_counter()
+
+    # Como en Picamera2, cada captura espera al siguiente frame completo
+    def _next_frame(self, timeout=5.0):
+        with self.cond:
+            seq = self.seq
+            if not self.cond.wait_for(lambda: self.seq != seq, timeout=timeout):
+                raise RuntimeError("Simulated camera timeout")
+            return self.frame
+
+    # El stream "main" sólo se escala cuando se pide (puede ser de 12 MP)
+    def _main(self, frame):
+        import cv2
+        if (frame.shape[1], frame.shape[0]) == self.main_size:
+            return frame
+        return cv2.resize(frame, self.main_size, interpolation=cv2.INTER_CUBIC)
+
+    def capture_buffer(self, name="main"):
+        return self.capture_array(name).ravel()
+
+    def capture_array(self, name="main"):
+        frame, yuv = self._next_frame()
+        if name == "lores":
+            return yuv
+        return self._main(frame)
+
+    def start_encoder(self, encoder, output, name="main", **kwargs):
+        self.recorders[id(encoder)] = SimulatedRecorder(output, name, self.fps)
+
+    def stop_encoder(self, encoders=None):
+        if encoders is None:
+            targets = list(self.recorders)
+        else:
+            encoders = encoders if isinstance(encoders, (list, tuple)) else [encoders]
+            targets = [id(e) for e in encoders]
+        for key in targets:
+            recorder = self.recorders.pop(key, None)
+            if recorder is not None:
+                recorder.close()
+
+    def start_recording(self, encoder, output, name="main", **kwargs):
+        self.start_encoder(encoder, output, name=name)
+
+    def stop_recording(self):
+        self.stop_encoder()
+
+
+# Graba los frames simulados con cv2.VideoWriter en la ruta del output. Con
+# segment_time se abre un archivo nuevo (patrón con %03d) cada N segundos.
+class SimulatedRecorder:
+    def __init__(self, output, stream, fps):
+        self.output = output
+        self.stream = stream
+        self.fps = fps
+        self.writer = None
+        self.frames = 0
+        self.segment = 0
+        self.lock = threading.Lock()
+
+    def write(self, frame):
+        import cv2
+        with self.lock:
+            segment_frames = int(self.output.segment_time * self.fps) if self.output.segment_time else 0
+            if segment_frames and self.frames and self.frames % segment_frames == 0:
+                self.writer.release()
+                self.writer = None
+                self.segment += 1
+            if self.writer is None:
+                h, w = frame.shape[:2]
+                path = self.output.path % self.segment if self.output.segment_time else self.output.path
+                self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (w, h))
+            self.writer.write(frame)
+            self.frames += 1
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.release()
+                self.writer = None
+
+
+class SimulatedH264Encoder:
+    def __init__(self, bitrate=None, **kwargs):
+        self.bitrate = bitrate
+
+
+# Sustituto de FfmpegOutput: del argumento sólo usa -segment_time y la
+# ruta final (patrón de segmentos)
+class SimulatedFfmpegOutput:
+    def __init__(self, output_filename, **kwargs):
+        args = output_filename.split()
+        self.path = args[-1]
+        self.segment_time = None
+        if "-segment_time" in args:
+            self.segment_time = float(args[args.index("-segment_time") + 1])
@@ -0,0 +1,189 @@
+# jobs.py
+import functools
+import multiprocessing
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _warmup():
+    return True
+
+
+# ========== Cola de trabajos ==========
+# Pool de procesos acotado para segmentación/clasificación. Cada trabajo tiene
+# un id y un estado consultable; cuando hay max_pending trabajos sin terminar
+# submit() devuelve None (o espera, con block=True) para aplicar contrapresión.
+# `observe(job)` se llama con cada trabajo terminado, antes de su on_done.
+# Un fallo en esos callbacks (que mueven la adquisición, el seguimiento y los
+# contadores) se registra con `log` y queda en el trabajo como
+# "callback_error" en vez de perderse.
+class JobQueue:
+    def __init__(self, max_workers=2, max_pending=8, history=200, observe=None, log=print):
+        self.max_workers = max_workers
+        self.executor = self._new_executor()
+        self.max_pending = max_pending
+        self.history = history
+        self.observe = observe
+        self.log = log
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(max_pending)
+        self.jobs = OrderedDict()
+        self.futures = {}
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.callback_errors = 0
+
+    # fork: los workers heredan el clasificador ya cargado y no vuelven a
+    # importar app.py (que inicializa cámara y GPIO al importarse)
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("fork")
+        )
+
+    # Si un worker muere (p. ej. un segfault en OpenCV) el pool queda roto y
+    # todo submit posterior fallaría: se sustituye por uno nuevo. Sólo la
+    # primera llamada por pool roto lo sustituye; los trabajos que estaban en
+    # él terminan con error.
+    def _restart(self, broken):
+        with self.lock:
+            if self.executor is not broken:
+                return
+            self.executor = self._new_executor()
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    # Arranca los workers ahora, antes de que existan hilos de cámara
+    def start(self):
+        self.executor.submit(_warmup).result()
+
+    def is_full(self):
+        with self.lock:
+            return self.pending >= self.max_pending
+
+    # bypass=True salta el límite de max_pending: para trabajos cortos que
+    # se lanzan desde el callback de otro trabajo, donde esperar un hueco
+    # podría bloquear la liberación de los huecos
+    def submit(self, kind, fn, *args, on_done=None, block=False, timeout=None, bypass=False):
+        if not bypass and not self.slots.acquire(blocking=block, timeout=timeout if block else None):
+            with self.lock:
+                self.rejected += 1
+            return None
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "submitted": time.time(),
+            "finished": None,
+            "result": None,
+            "error": None,
+            "callback_error": None
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+            self.pending += 1
+            self._trim()
+
+        executor = self.executor
+        try:
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._restart(executor)
+                executor = self.executor
+                future = executor.submit(fn, *args)
+        except Exception as e:
+            self._finish(job, None, e, on_done, not bypass)
+            return job_id
+
+        with self.lock:
+            self.futures[job_id] = future
+        future.add_done_callback(functools.partial(self._on_future_done, job, on_done, not bypass, executor))
+        return job_id
+
+    def _on_future_done(self, job, on_done, slot, executor, future):
+        if future.cancelled():
+            self._finish(job, None, "cancelled", on_done, slot)
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._restart(executor)
+        self._finish(job, None if error else future.result(), error, on_done, slot)
+
+    def _finish(self, job, result, error, on_done, slot):
+        with self.lock:
+            job["finished"] = time.time()
+            if error is None:
+                job["status"] = "done"
+                job["result"] = result
+                self.completed += 1
+            else:
+                job["status"] = "error"
+                job["error"] = str(error)
+                self.failed += 1
+            self.futures.pop(job["id"], None)
+            self.pending -= 1
+        if slot:
+            self.slots.release()
+        if self.observe is not None:
+            self._callback(job, "observe", self.observe)
+        if on_done is not None:
+            self._callback(job, "on_done", on_done)
+
+    def _callback(self, job, name, callback):
+        try:
+            callback(job)
+        except Exception as e:
+            with self.lock:
+                job["callback_error"] = f"{name}: {e}"
+                self.callback_errors += 1
+            self.log(f"Job {job['id']} ({job['kind']}) {name} callback failed: {e}\n{traceback.format_exc()}")
+
+    # Conserva como mucho `history` trabajos terminados
+    def _trim(self):
+        excess = len(self.jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id]["status"] in ("done", "error"):
+                del self.jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            future = self.futures.get(job_id)
+        if job["status"] == "queued" and future is not None and future.running():
+            job["status"] = "running"
+        return job
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+                "callback_errors": self.callback_errors
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
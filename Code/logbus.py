@@ -0,0 +1,73 @@
+# logbus.py
+import threading
+import time
+from collections import deque
+
+
+def format_event(seq, msg):
+    data = str(msg).replace("\n", "\ndata: ")
+    return f"id: {seq}\ndata: {data}\n\n"
+
+
+# ========== Bus de mensajes de consola ==========
+# Buffer circular con los últimos `capacity` mensajes, cada uno con un número
+# de secuencia creciente. Cada suscriptor lleva su propio cursor, así que todos
+# los clientes reciben todos los mensajes (no sólo el primero que los saque de
+# una cola). publish() no bloquea más que lo que tarda un append bajo lock.
+class LogBus:
+    def __init__(self, capacity=1000, max_backlog=200):
+        self.cond = threading.Condition()
+        self.messages = deque(maxlen=capacity)
+        self.seq = 0
+        self.max_backlog = max_backlog
+
+    def publish(self, msg):
+        with self.cond:
+            self.seq += 1
+            self.messages.append((self.seq, msg))
+            self.cond.notify_all()
+        return self.seq
+
+    def last_seq(self):
+        with self.cond:
+            return self.seq
+
+    # Mensajes con secuencia > cursor. Si el cliente se quedó más atrás que
+    # max_backlog (o que el buffer), se saltan los más antiguos y se indica
+    # cuántos se perdieron.
+    def read(self, cursor):
+        with self.cond:
+            if self.seq <= cursor:
+                return [], 0
+            first = self.messages[0][0] if self.messages else self.seq + 1
+            start = max(cursor + 1, first, self.seq - self.max_backlog + 1)
+            skipped = start - (cursor + 1)
+            offset = start - first
+            items = [self.messages[i] for i in range(offset, len(self.messages))]
+            return items, skipped
+
+    def wait(self, cursor, timeout):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.seq > cursor, timeout=timeout)
+
+    # Generador SSE: cada evento lleva "id:" para que EventSource pueda
+    # reanudar con Last-Event-ID; los comentarios periódicos mantienen viva la
+    # conexión y detectan clientes desconectados.
+    def sse(self, cursor=None, greeting=None, keepalive=15.0):
+        last = self.last_seq()
+        # Un Last-Event-ID mayor que la secuencia actual viene de antes de un
+        # reinicio del servidor: se reenvía todo el buffer
+        if cursor is None or cursor > last:
+            cursor = 0 if cursor is not None else last
+        if greeting:
+            yield f"data: {greeting}\n\n"
+        while True:
+            items, skipped = self.read(cursor)
+            if skipped:
+                yield f"data: [{time.strftime('%H:%M:%S')}] ... {skipped} messages skipped\n\n"
+            if items:
+                cursor = items[-1][0]
+                yield "".join(format_event(seq, msg) for seq, msg in items)
+                continue
+            if not self.wait(cursor, keepalive):
+                yield ": keepalive\n\n"
@@ -0,0 +1,148 @@
+# metrics.py
+import bisect
+import threading
+
+# Límites (en segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+# ========== Métricas ==========
+# Contadores e histogramas con todas sus series creadas al registrarlos: una
+# etiqueta opcional con sus valores posibles fijados de antemano, y registrar
+# un evento sólo suma sobre listas ya reservadas bajo un lock. Un valor de
+# etiqueta no declarado se ignora en vez de crear series nuevas. El texto
+# en formato Prometheus se genera sólo al consultar /metrics.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, label=None, values=(None,)):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = tuple(values)
+        self.index = {value: i for i, value in enumerate(self.values)}
+        self.lock = threading.Lock()
+        self.totals = [0.0] * len(self.values)
+
+    def inc(self, amount=1, value=None):
+        i = self.index.get(value)
+        if i is None:
+            return
+        with self.lock:
+            self.totals[i] += amount
+
+    def _labels(self, value):
+        return ((self.label, value),) if self.label else ()
+
+    def samples(self):
+        with self.lock:
+            totals = list(self.totals)
+        for value, total in zip(self.values, totals):
+            yield self.name, self._labels(value), total
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name, help, label=None, values=(None,), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, label, values)
+        self.buckets = tuple(buckets)
+        self.counts = [[0] * (len(self.buckets) + 1) for _ in self.values]
+        self.sums = [0.0] * len(self.values)
+
+    # `count` eventos de `seconds` cada uno (p. ej. la media por objeto de
+    # un lote clasificado de una vez)
+    def observe(self, seconds, value=None, count=1):
+        i = self.index.get(value)
+        if i is None or count <= 0:
+            return
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[i][slot] += count
+            self.sums[i] += seconds * count
+            self.totals[i] += count
+
+    def samples(self):
+        with self.lock:
+            counts = [list(c) for c in self.counts]
+            sums = list(self.sums)
+            totals = list(self.totals)
+        for value, bucket_counts, total_sum, total in zip(self.values, counts, sums, totals):
+            labels = self._labels(value)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += n
+                yield self.name + "_bucket", labels + (("le", format_value(bound)),), cumulative
+            yield self.name + "_sum", labels, total_sum
+            yield self.name + "_count", labels, total
+
+
+# Valor leído de otro objeto al consultar (clientes conectados, trabajos
+# pendientes...): `read()` devuelve un número o un dict valor_etiqueta -> número
+class Callback:
+    def __init__(self, name, help, read, kind="gauge", label=None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+        self.label = label
+
+    def samples(self):
+        try:
+            current = self.read()
+        except Exception:
+            return
+        if isinstance(current, dict):
+            for value, number in current.items():
+                yield self.name, ((self.label, value),), number
+        else:
+            yield self.name, (), current
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def _add(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label=None, values=(None,)):
+        return self._add(Counter(name, help, label, values))
+
+    def histogram(self, name, help, label=None, values=(None,), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, label, values, buckets))
+
+    def gauge(self, name, help, read, label=None):
+        return self._add(Callback(name, help, read, "gauge", label))
+
+    # Contador que ya lleva otro objeto (p. ej. trabajos completados)
+    def counter_callback(self, name, help, read, label=None):
+        return self._add(Callback(name, help, read, "counter", label))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
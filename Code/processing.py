@@ -0,0 +1,229 @@
+# processing.py
+import csv
+import os
+import time
+import cv2
+from segmentation import FEATURE_COLUMNS, segment_background, segment_objects, segment_tiled
+from classification import CLASSIFIER_AVAILABLE, classify_batch, result_cache
+
+# Este módulo se ejecuta dentro de los procesos del pool de trabajos: no debe
+# tocar la cámara, el GPIO ni el estado global de app.py. Los mensajes de
+# consola se devuelven en el resultado y los publica el proceso principal.
+
+def annotate_frame(frame, classifications):
+    for obj in classifications:
+        x, y, w, h = obj["x"], obj["y"], obj["w"], obj["h"]
+        label = obj["label"]
+        confidence = obj["confidence"]
+        color = (0, 255, 0) if label != "unknown" else (0, 0, 255)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+        label_text = f"{label} ({int(confidence)}%)" if confidence > 0 else "unknown"
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_scale = 0.5
+        thickness = 1
+        text_x = x + 5
+        text_y = y - 10 if y - 10 > 10 else y + h + 20
+        cv2.putText(frame, label_text, (text_x, text_y), font, font_scale, color, thickness)
+    return frame
+
+def summarize(classifications):
+    class_count = {}
+    for obj in classifications:
+        label = obj["label"]
+        class_count[label] = class_count.get(label, 0) + 1
+    if class_count:
+        summary = ", ".join([f"{k}: {v}" for k, v in class_count.items()])
+    else:
+        summary = "No objects classified"
+    return class_count, summary
+
+# Tabla de medidas por objeto (una fila por objeto, una columna por medida).
+# Con seguimiento cada clasificación lleva además la pista ("track").
+def write_features(path, objects, classifications):
+    tracked = any("track" in cls for cls in classifications)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["object", "x", "y", "w", "h"] + FEATURE_COLUMNS + ["label", "confidence"]
+                        + (["track"] if tracked else []))
+        for i, (obj, cls) in enumerate(zip(objects, classifications)):
+            writer.writerow(
+                [i, obj["x"], obj["y"], obj["w"], obj["h"]]
+                + [f"{obj[name]:.6g}" for name in FEATURE_COLUMNS]
+                + [cls["label"], cls["confidence"]]
+                + ([cls.get("track", "")] if tracked else [])
+            )
+
+# Con `background` (fondo en gris del tamaño del frame) se segmenta por
+# sustracción con un umbral global. Si no, con `tiling` (sección "capture" de
+# config.json) el frame se segmenta por teselas con umbrales de área
+# absolutos, y sin ninguno de los dos como un frame de preview. `timings`
+# acumula la duración de cada etapa (ver StageTimer).
+def segment(bgr_frame, tiling=None, background=None, threshold=0.15, timings=None):
+    if background is not None and background.shape == bgr_frame.shape[:2]:
+        if tiling:
+            return segment_background(bgr_frame, background, threshold, min_area=tiling["min_area"],
+                                      max_area_frac=tiling["max_area_frac"], timings=timings)
+        return segment_background(bgr_frame, background, threshold, timings=timings)
+    if not tiling:
+        return segment_objects(bgr_frame, timings=timings)
+    return segment_tiled(
+        bgr_frame,
+        tile_size=tiling["tile_size"],
+        overlap=tiling["tile_overlap"],
+        workers=tiling["tile_workers"],
+        min_area=tiling["min_area"],
+        max_area_frac=tiling["max_area_frac"],
+        timings=timings
+    )
+
+# `cache` es la sección "classification" de config.json: activa la caché de
+# resultados del proceso y la ajusta antes de clasificar. En `timings` se
+# acumula el tiempo de clasificación ("classify") y los recortes que llegaron
+# al clasificador ("classified"), para la latencia por objeto.
+def classify_with_cache(crops, samples_dir, cache, timings=None):
+    started = time.perf_counter()
+    if not cache or not cache["cache"]:
+        results, counts = classify_batch(crops, tmp_dir=samples_dir), None
+        classified = len(crops)
+    else:
+        result_cache.configure(cache["cache_size"], cache["cache_ttl"], cache["hash_threshold"])
+        before = result_cache.stats()
+        results = classify_batch(crops, tmp_dir=samples_dir, cache=result_cache)
+        after = result_cache.stats()
+        counts = {"hits": after["hits"] - before["hits"], "misses": after["misses"] - before["misses"]}
+        classified = counts["misses"]
+    if timings is not None and CLASSIFIER_AVAILABLE and classified:
+        timings["classify"] = timings.get("classify", 0.0) + time.perf_counter() - started
+        timings["classified"] = timings.get("classified", 0) + classified
+    return results, counts
+
+# Nitidez del recorte: varianza del laplaciano sobre el gris
+def sharpness(crop):
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+# Objetos con todas sus medidas y su nitidez, y sus recortes, para el
+# seguimiento: sólo el más enfocado de cada organismo se clasifica (ver
+# tracking.py), así que aquí no se clasifica
+def track_objects(crops, objects):
+    tracked = [dict(obj, sharpness=sharpness(crop)) for obj, crop in zip(objects, crops)]
+    return tracked, [crop.copy() for crop in crops]
+
+# ========== Trabajo de clasificación de recortes ==========
+def classify_crops(crops, samples_dir, cache=None):
+    timings = {}
+    results, cache_counts = classify_with_cache(crops, samples_dir, cache, timings)
+    return {"results": results, "cache": cache_counts, "timings": timings}
+
+# ========== Trabajo de foto ==========
+def process_photo(bgr_frame, photo_id, img_filename, samples_dir, tiling=None, background=None, threshold=0.15, cache=None, track=False):
+    log = []
+    timings = {}
+    objects = segment(bgr_frame, tiling, background, threshold, timings)
+
+    # Vistas sin copia sobre el frame original
+    crops = [bgr_frame[o["y"]:o["y"]+o["h"], o["x"]:o["x"]+o["w"]] for o in objects]
+    if track:
+        # Cada objeto lleva la etiqueta de su pista: su tabla de medidas y sus
+        # filas del catálogo se escriben cuando se clasifica (ver
+        # SequenceTracker.labeled_frames)
+        tracked, track_crops = track_objects(crops, objects)
+        summary = f"{len(objects)} objects tracked"
+        return {
+            "status": "ok",
+            "file": img_filename,
+            "class": "multiple",
+            "confidence": 0.0,
+            "objects": None,
+            "features_file": None,
+            "class_count": {},
+            "summary": summary,
+            "cache": None,
+            "tracked": tracked,
+            "crops": track_crops,
+            "timings": timings,
+            "log": [summary]
+        }
+
+    results, cache_counts = classify_with_cache(crops, samples_dir, cache, timings)
+    classifications = []
+    for obj, result in zip(objects, results):
+        if "error" in result:
+            log.append(f"Classification error: {result['error']}")
+        elif CLASSIFIER_AVAILABLE:
+            log.append(f"Object classification: {result['label']} ({result['confidence']:.1f}%)")
+
+        classifications.append({
+            "x": obj["x"],
+            "y": obj["y"],
+            "w": obj["w"],
+            "h": obj["h"],
+            "label": result["label"],
+            "confidence": result["confidence"]
+        })
+
+    features_filename = None
+    if objects:
+        features_filename = f"photo_{photo_id}_objects.csv"
+        write_features(os.path.join(samples_dir, features_filename), objects, classifications)
+
+    class_count, summary = summarize(classifications)
+    log.append(f"Classification summary: {summary}" if class_count else summary)
+
+    # ✅ Guardar la imagen ANOTADA con el nombre clasificado
+    if classifications:
+        annotated_frame = annotate_frame(bgr_frame.copy(), classifications)
+        first_class = classifications[0]["label"]
+        first_conf = int(classifications[0]["confidence"])
+        annotated_filename = f"plankton_{first_class}_{first_conf}_{photo_id}_annotated.jpg"
+        cv2.imwrite(os.path.join(samples_dir, annotated_filename), annotated_frame)
+        log.append(f"Annotated image saved: {annotated_filename}")
+        final_filename = annotated_filename
+    else:
+        final_filename = img_filename
+
+    return {
+        "status": "ok",
+        "file": final_filename,
+        "class": "multiple",
+        "confidence": 0.0,
+        "objects": classifications,
+        "features_file": features_filename,
+        "class_count": class_count,
+        "summary": summary,
+        "cache": cache_counts,
+        "tracked": None,
+        "crops": None,
+        "timings": timings,
+        "log": log
+    }
+
+# ========== Trabajo de frame de vídeo ==========
+# Misma segmentación y clasificación que las fotos, para un frame decodificado
+# de una grabación. Devuelve las medidas de cada objeto y su miniatura JPEG
+# (lado mayor `thumb_size`) en memoria: el proceso principal las escribe.
+def process_video_frame(bgr_frame, frame_index, samples_dir, thumb_size=128, tiling=None, background=None, threshold=0.15, cache=None):
+    timings = {}
+    objects = segment(bgr_frame, tiling, background, threshold, timings)
+    crops = [bgr_frame[o["y"]:o["y"]+o["h"], o["x"]:o["x"]+o["w"]] for o in objects]
+    results, cache_counts = classify_with_cache(crops, samples_dir, cache, timings)
+
+    thumbnails = []
+    for obj, crop, result in zip(objects, crops, results):
+        obj["label"] = result["label"]
+        obj["confidence"] = result["confidence"]
+        scale = min(thumb_size / max(crop.shape[:2]), 1.0)
+        if scale < 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        thumbnails.append(buffer.tobytes() if ok else None)
+
+    class_count, _ = summarize(objects)
+    return {
+        "frame": frame_index,
+        "objects": objects,
+        "thumbnails": thumbnails,
+        "class_count": class_count,
+        "cache": cache_counts,
+        "timings": timings
+    }
@@ -0,0 +1,72 @@
+# recording.py
+import os
+import re
+import threading
+
+# ========== Grabación por segmentos ==========
+# El H.264 del encoder va directo a ffmpeg (FfmpegOutput de Picamera2), que
+# lo empaqueta sin recodificar en MP4 fragmentados de `seconds` segundos:
+# video_N_000.mp4, video_N_001.mp4... Con empty_moov cada segmento es
+# reproducible mientras se escribe, y un corte de luz sólo afecta al último.
+# FfmpegOutput separa su argumento por espacios, así que las opciones del
+# muxer de segmentos van delante del patrón de nombre.
+MP4_FRAGMENT_FLAGS = "movflags=+frag_keyframe+empty_moov+default_base_moof"
+
+
+def segment_pattern(prefix):
+    return f"{prefix}_%03d.mp4"
+
+
+def segment_args(path_pattern, seconds):
+    return (
+        f"-f segment -segment_time {seconds} -segment_format mp4 "
+        f"-segment_format_options {MP4_FRAGMENT_FLAGS} -reset_timestamps 1 {path_pattern}"
+    )
+
+
+# Vigila el directorio durante la grabación: un segmento está terminado
+# cuando ya existe el siguiente (o cuando la grabación se detiene)
+class SegmentMonitor:
+    def __init__(self, directory, prefix, on_segment, interval=1.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.on_segment = on_segment
+        self.interval = interval
+        self.regex = re.compile(re.escape(prefix) + r"_(\d{3,})\.mp4$")
+        self.lock = threading.Lock()
+        self.finished = []
+        self.current = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="segment-monitor", daemon=True)
+        self.thread.start()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = self.regex.match(name)
+            if match:
+                found.append((int(match.group(1)), name))
+        return [name for _, name in sorted(found)]
+
+    def _publish(self, names, final):
+        with self.lock:
+            done = names if final else names[:-1]
+            new = [name for name in done if name not in self.finished]
+            self.finished += new
+            self.current = None if final or not names else names[-1]
+        for name in new:
+            self.on_segment(name)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self._publish(self._scan(), final=False)
+
+    # Llamar cuando el encoder ya se detuvo y ffmpeg cerró el último segmento
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self._publish(self._scan(), final=True)
+
+    def status(self):
+        with self.lock:
+            return {"finished": list(self.finished), "current": self.current}
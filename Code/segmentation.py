@@ -0,0 +1,307 @@
+# segmentation.py
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+FEATURE_COLUMNS = [
+    "area", "perimeter", "major", "minor", "esd", "solidity", "convexity",
+    "circularity", "elongation", "mean", "std",
+    "hu1", "hu2", "hu3", "hu4", "hu5", "hu6", "hu7"
+]
+
+STAGES = ["gray", "clahe", "blur", "threshold", "subtract", "morphology", "label", "measure"]
+
+
+# Acumula en `timings` (si se pasa) la duración de cada etapa en segundos
+class StageTimer:
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    # Descarta el tiempo transcurrido desde la última marca
+    def reset(self):
+        self.last = time.perf_counter()
+
+
+# ========== Segmentación de objetos ==========
+# gris -> CLAHE -> GaussianBlur -> adaptiveThreshold -> apertura morfológica ->
+# componentes conexas -> filtro por área -> morfometría. Devuelve un dict por
+# objeto con su caja envolvente y sus medidas (FEATURE_COLUMNS).
+def segment_objects(bgr_frame, min_area_frac=0.0005, max_area_frac=0.01, timings=None):
+    timer = StageTimer(timings)
+    H, W = bgr_frame.shape[:2]
+    raw_gray = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2GRAY)
+    timer.mark("gray")
+    th = threshold_mask(raw_gray, timer)
+
+    min_area = min_area_frac * H * W
+    max_area = max_area_frac * H * W
+    return label_objects(th, raw_gray, min_area, max_area, timer)
+
+
+# Máscara binaria de objetos (255) sobre fondo (0) a partir del gris
+def threshold_mask(raw_gray, timer):
+    return binarize(equalize(raw_gray, timer), timer)
+
+
+# CLAHE reparte su rejilla de 8x8 sobre la imagen que recibe: para que el
+# contraste no cambie en las costuras se aplica una vez al frame completo
+def equalize(raw_gray, timer):
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    gray = clahe.apply(raw_gray)
+    timer.mark("clahe")
+    return gray
+
+
+# Blur, umbral adaptativo y apertura: operaciones locales (radio < 32 px)
+def binarize(gray, timer):
+    blur = cv2.GaussianBlur(gray, (5,5), 0)
+    timer.mark("blur")
+    th = cv2.adaptiveThreshold(
+        blur, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV,
+        31, 3
+    )
+    timer.mark("threshold")
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
+    th = cv2.morphologyEx(th, cv2.MORPH_OPEN, kernel, iterations=2)
+    timer.mark("morphology")
+    return th
+
+
+# ========== Segmentación por sustracción de fondo ==========
+# Con un fondo (flat-field, ver background.py) basta dividir por él y aplicar
+# un umbral global: los objetos son los píxeles `threshold` veces más oscuros
+# que el fondo. Lo que no se mueve entre frames (polvo, rayas, viñeteo) queda
+# en el fondo y no genera contornos. Sin CLAHE ni umbral adaptativo.
+def segment_background(bgr_frame, background, threshold=0.15, min_area=None,
+                       min_area_frac=0.0005, max_area_frac=0.01, timings=None):
+    timer = StageTimer(timings)
+    H, W = bgr_frame.shape[:2]
+    raw_gray = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2GRAY)
+    timer.mark("gray")
+    # gray < background * (1 - threshold), en enteros para no pasar a float
+    limit = cv2.convertScaleAbs(background, alpha=1.0 - threshold)
+    th = cv2.compare(raw_gray, limit, cv2.CMP_LT)
+    timer.mark("subtract")
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
+    th = cv2.morphologyEx(th, cv2.MORPH_OPEN, kernel, iterations=2)
+    timer.mark("morphology")
+
+    if min_area is None:
+        min_area = min_area_frac * H * W
+    return label_objects(th, raw_gray, min_area, max_area_frac * H * W, timer)
+
+
+# ========== Segmentación por teselas ==========
+# Para el stream "main" a resolución completa. El CLAHE se aplica una vez al
+# frame completo (es global: por teselas el contraste cambiaría en cada
+# costura). Cada tesela se umbraliza con un margen de `overlap` píxeles (el
+# contexto que necesitan el blur, el umbral adaptativo y la apertura) y sólo
+# su núcleo se escribe en la máscara compartida, así que con overlap >= 32 la
+# máscara es la misma que sin teselas. Como cada píxel pertenece al núcleo de
+# una sola tesela y el etiquetado se hace una vez sobre la máscara completa,
+# un objeto que cruza una costura sale una sola vez. OpenCV libera el GIL,
+# así que las teselas se reparten entre hilos.
+def tile_cores(H, W, tile_size):
+    for y0 in range(0, H, tile_size):
+        for x0 in range(0, W, tile_size):
+            yield y0, min(y0 + tile_size, H), x0, min(x0 + tile_size, W)
+
+
+def segment_tiled(bgr_frame, tile_size=1024, overlap=64, workers=4,
+                  min_area=100, max_area_frac=0.01, timings=None):
+    timer = StageTimer(timings)
+    H, W = bgr_frame.shape[:2]
+    raw_gray = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2GRAY)
+    timer.mark("gray")
+    gray = equalize(raw_gray, timer)
+    mask = np.empty((H, W), dtype=np.uint8)
+
+    def run(core):
+        y0, y1, x0, x1 = core
+        py0, py1 = max(y0 - overlap, 0), min(y1 + overlap, H)
+        px0, px1 = max(x0 - overlap, 0), min(x1 + overlap, W)
+        tile_timings = {} if timings is not None else None
+        tile_mask = binarize(gray[py0:py1, px0:px1], StageTimer(tile_timings))
+        mask[y0:y1, x0:x1] = tile_mask[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+        return tile_timings
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for tile_timings in pool.map(run, tile_cores(H, W, tile_size)):
+            # Tiempos de etapa sumados sobre todas las teselas (no de pared)
+            for stage, elapsed in (tile_timings or {}).items():
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+    timer.reset()
+    return label_objects(mask, raw_gray, min_area, max_area_frac * H * W, timer)
+
+
+# Etiqueta la máscara binaria, filtra por área y mide los objetos que quedan.
+# La selección es la de siempre: área del contorno externo (contourArea, no
+# el número de píxeles: incluye los huecos y descuenta medio píxel de borde)
+# entre min_area y max_area, y perímetro no nulo. Los objetos dentro del
+# hueco de otro no tienen contorno externo propio y no se cuentan. Cada
+# contorno se asigna a su componente por el píxel de su primer punto.
+def label_objects(mask, gray, min_area, max_area, timer=None):
+    timer = timer or StageTimer(None)
+    n, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    timer.mark("label")
+    keep = np.zeros(n, dtype=bool)
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if min_area <= area <= max_area and cv2.arcLength(contour, True) > 0:
+            x, y = contour[0][0]
+            keep[labels[y, x]] = True
+    keep[0] = False
+    if not keep.any():
+        timer.mark("label")
+        return []
+
+    # Reetiquetar: 0 = fondo o descartado, 1..k = objetos conservados
+    remap = np.zeros(n, dtype=np.int32)
+    kept = np.flatnonzero(keep)
+    remap[kept] = np.arange(1, len(kept) + 1, dtype=np.int32)
+    labels = remap[labels]
+    timer.mark("label")
+    features = measure_objects(labels, len(kept), stats[kept], centroids[kept], gray)
+
+    objects = []
+    for i in range(len(kept)):
+        x, y, w, h = (int(v) for v in stats[kept[i], :4])
+        obj = {"x": x, "y": y, "w": w, "h": h}
+        for name in FEATURE_COLUMNS:
+            obj[name] = float(features[name][i])
+        objects.append(obj)
+    timer.mark("measure")
+    return objects
+
+
+# ========== Morfometría vectorizada ==========
+# Todas las medidas salen de reducciones NumPy (bincount) sobre la imagen de
+# etiquetas, una pasada por medida para todos los objetos a la vez. Sólo el
+# casco convexo (solidez/convexidad) necesita un bucle por objeto.
+def measure_objects(labels, count, stats, centroids, gray):
+    H, W = labels.shape
+    size = count + 1
+    flat = labels.ravel()
+    idx = np.flatnonzero(flat)
+    lab = flat[idx]
+    ys, xs = np.divmod(idx, W)
+
+    area = stats[:, cv2.CC_STAT_AREA].astype(np.float64)
+    safe_area = np.maximum(area, 1.0)
+
+    # Momentos centrales de segundo y tercer orden
+    dx = xs - centroids[:, 0][lab - 1]
+    dy = ys - centroids[:, 1][lab - 1]
+    def moment(values):
+        return np.bincount(lab, weights=values, minlength=size)[1:]
+    dx2 = dx * dx
+    dy2 = dy * dy
+    mu20 = moment(dx2)
+    mu02 = moment(dy2)
+    mu11 = moment(dx * dy)
+    mu30 = moment(dx2 * dx)
+    mu03 = moment(dy2 * dy)
+    mu21 = moment(dx2 * dy)
+    mu12 = moment(dx * dy2)
+
+    # Ejes de la elipse con los mismos momentos de segundo orden
+    a = mu20 / safe_area
+    c = mu02 / safe_area
+    b = mu11 / safe_area
+    root = np.sqrt(((a - c) / 2) ** 2 + b * b)
+    major = 4 * np.sqrt(np.maximum((a + c) / 2 + root, 0))
+    minor = 4 * np.sqrt(np.maximum((a + c) / 2 - root, 0))
+
+    # Intensidad sobre el gris original (sin CLAHE)
+    values = gray.ravel()[idx].astype(np.float64)
+    mean = moment(values) / safe_area
+    std = np.sqrt(np.maximum(moment(values * values) / safe_area - mean * mean, 0))
+
+    # Perímetro: aristas objeto/fondo en vecindad 4, corregidas por pi/4
+    # para aproximar la longitud del contorno real
+    padded = np.pad(labels, 1)
+    center = padded[1:-1, 1:-1]
+    edges = np.zeros(size, dtype=np.float64)
+    boundary = np.zeros(center.shape, dtype=bool)
+    for neighbour in (padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]):
+        border = (center > 0) & (neighbour != center)
+        edges += np.bincount(center[border], minlength=size)
+        boundary |= border
+    perimeter = edges[1:] * (math.pi / 4)
+    safe_perimeter = np.maximum(perimeter, 1e-9)
+
+    # Casco convexo a partir de los píxeles de borde agrupados por etiqueta
+    b_idx = np.flatnonzero(boundary.ravel())
+    b_lab = flat[b_idx]
+    order = np.argsort(b_lab, kind="stable")
+    b_idx = b_idx[order]
+    splits = np.cumsum(np.bincount(b_lab, minlength=size)[1:])[:-1]
+    hull_area = np.zeros(count)
+    hull_perimeter = np.zeros(count)
+    for i, group in enumerate(np.split(b_idx, splits)):
+        if len(group) < 3:
+            continue
+        gy, gx = np.divmod(group, W)
+        hull = cv2.convexHull(np.stack([gx, gy], axis=1).astype(np.int32))
+        hull_area[i] = cv2.contourArea(hull)
+        hull_perimeter[i] = cv2.arcLength(hull, True)
+    # El casco pasa por los centros de los píxeles de borde: se añade medio
+    # píxel alrededor para compararlo con el área en píxeles
+    hull_area = hull_area + hull_perimeter / 2 + math.pi / 4
+    solidity = np.minimum(area / np.maximum(hull_area, 1e-9), 1.0)
+    convexity = np.minimum((hull_perimeter + math.pi) / safe_perimeter, 1.0)
+
+    # Momentos de Hu a partir de los momentos centrales normalizados
+    n20 = mu20 / safe_area ** 2
+    n02 = mu02 / safe_area ** 2
+    n11 = mu11 / safe_area ** 2
+    norm3 = safe_area ** 2.5
+    n30 = mu30 / norm3
+    n03 = mu03 / norm3
+    n21 = mu21 / norm3
+    n12 = mu12 / norm3
+    t0 = n30 + n12
+    t1 = n21 + n03
+    q0 = n30 - 3 * n12
+    q1 = 3 * n21 - n03
+    hu1 = n20 + n02
+    hu2 = (n20 - n02) ** 2 + 4 * n11 ** 2
+    hu3 = q0 ** 2 + q1 ** 2
+    hu4 = t0 ** 2 + t1 ** 2
+    hu5 = q0 * t0 * (t0 ** 2 - 3 * t1 ** 2) + q1 * t1 * (3 * t0 ** 2 - t1 ** 2)
+    hu6 = (n20 - n02) * (t0 ** 2 - t1 ** 2) + 4 * n11 * t0 * t1
+    hu7 = q1 * t0 * (t0 ** 2 - 3 * t1 ** 2) - q0 * t1 * (3 * t0 ** 2 - t1 ** 2)
+
+    return {
+        "area": area,
+        "perimeter": perimeter,
+        "major": major,
+        "minor": minor,
+        "esd": 2 * np.sqrt(area / math.pi),
+        "solidity": solidity,
+        "convexity": convexity,
+        "circularity": 4 * math.pi * area / (safe_perimeter * safe_perimeter),
+        "elongation": major / np.maximum(minor, 1e-9),
+        "mean": mean,
+        "std": std,
+        "hu1": hu1,
+        "hu2": hu2,
+        "hu3": hu3,
+        "hu4": hu4,
+        "hu5": hu5,
+        "hu6": hu6,
+        "hu7": hu7
+    }
@@ -0,0 +1,119 @@
+# statestore.py
+import json
+import os
+import threading
+
+# ========== Escritura atómica ==========
+# Se escribe un temporal en el mismo directorio, se sincroniza y se renombra
+# encima del original: tras un corte de luz queda el fichero anterior o el
+# nuevo completo, nunca uno a medias. El rename sólo es duradero cuando se
+# sincroniza también el directorio.
+def write_json_atomic(path, data, indent=None):
+    write_text_atomic(path, json.dumps(data, indent=indent))
+
+
+def write_text_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+# None si no existe o no se puede leer (p. ej. escrito a medias por una
+# versión anterior sin escritura atómica)
+def read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ========== Estado persistente ==========
+# Dict en memoria guardado en JSON. Los cambios sólo tocan memoria bajo el
+# lock; el primero programa una escritura a los `delay` segundos y todos los
+# de esa ventana van en la misma escritura atómica. flush() escribe ya lo
+# pendiente (al apagar). Las escrituras se serializan con su propio lock para
+# no retener el de los datos mientras se sincroniza con la tarjeta SD.
+class JsonStore:
+    def __init__(self, path, default, delay=2.0, indent=None):
+        self.path = path
+        self.delay = delay
+        self.indent = indent
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.timer = None
+        self.version = 0
+        self.saved = 0
+        self.error = None
+        loaded = read_json(path)
+        self.corrupt = loaded is None and os.path.exists(path)
+        self.data = dict(default)
+        if isinstance(loaded, dict):
+            self.data.update(loaded)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.data)
+
+    def update(self, **changes):
+        with self.lock:
+            self.data.update(changes)
+            self._changed()
+
+    # Suma 1 y devuelve el nuevo valor: dos peticiones simultáneas nunca
+    # obtienen el mismo número
+    def increment(self, key):
+        with self.lock:
+            value = self.data.get(key, 0) + 1
+            self.data[key] = value
+            self._changed()
+            return value
+
+    def _changed(self):
+        self.version += 1
+        if self.timer is None:
+            self.timer = threading.Timer(self.delay, self._flush_later)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except OSError as e:
+            # Se reintenta con el siguiente cambio o al apagar
+            self.error = str(e)
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                if self.version == self.saved:
+                    return False
+                version = self.version
+                text = json.dumps(self.data, indent=self.indent)
+            write_text_atomic(self.path, text)
+            with self.lock:
+                self.saved = version
+                self.error = None
+        return True
+
+    def status(self):
+        with self.lock:
+            return {"pending": self.version != self.saved, "error": self.error}
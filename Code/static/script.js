@@ -14,19 +14,23 @@ const app = {
     event.target.classList.add('active');
     if (viewName === 'samples') this.loadSamples();
     if (viewName === 'live') {
+      this.connectVideoFeed();
       this.connectLiveConsole();
+      this.connectOverlay();
       this.updateLedButton();
     }
     if (viewName === 'settings') this.loadConfig();
   },
 
-  loadSamples() {
+  loadSamples(cursor) {
     const body = document.getElementById("samplesBody");
     if (!body) return;
-    fetch("/api/samples")
+    const url = cursor ? `/api/samples?cursor=${encodeURIComponent(cursor)}` : "/api/samples";
+    fetch(url)
       .then(res => res.json())
-      .then(samples => {
-        body.innerHTML = samples.length ? samples.map(s => `
+      .then(page => {
+        const samples = page.items;
+        const rows = samples.map(s => `
           <tr>
             <td>${s.id}</td>
             <td>${s.time}</td>
@@ -36,13 +40,60 @@ const app = {
               <button class="btn btn-danger" onclick="app.deleteSample('${s.id}')">Delete</button>
             </td>
           </tr>
-        `).join('') : '<tr><td colspan="4">No samples</td></tr>';
+        `).join('');
+        const more = page.next_cursor ? `
+          <tr id="samplesMore">
+            <td colspan="4"><button class="btn" onclick="app.loadSamples('${page.next_cursor}')">Load more</button></td>
+          </tr>
+        ` : '';
+        if (cursor) {
+          const previous = document.getElementById("samplesMore");
+          if (previous) previous.remove();
+          body.insertAdjacentHTML("beforeend", rows + more);
+        } else {
+          body.innerHTML = samples.length ? rows + more : '<tr><td colspan="4">No samples</td></tr>';
+        }
       })
       .catch(err => {
         body.innerHTML = `<tr><td colspan="4" style="color:#ef4444;">Load error: ${err.message}</td></tr>`;
       });
   },
 
+  // Pide al servidor el ancho que realmente se muestra: los móviles reciben
+  // una variante más pequeña y el servidor la ajusta a sus perfiles
+  connectVideoFeed() {
+    const img = document.getElementById("videoFeed");
+    if (!img) return;
+    const width = Math.round((img.parentElement.clientWidth || 640) * (window.devicePixelRatio || 1));
+    const src = `/video_feed?width=${width}`;
+    if (img.getAttribute("src") !== src) img.setAttribute("src", src);
+  },
+
+  connectOverlay() {
+    const img = document.getElementById("videoFeed");
+    const canvas = document.getElementById("videoOverlay");
+    if (!img || !canvas) return;
+    if (this.overlaySource) this.overlaySource.close();
+    this.overlaySource = new EventSource("/api/overlay/stream");
+    this.overlaySource.onmessage = (e) => {
+      const overlay = JSON.parse(e.data);
+      canvas.width = img.clientWidth;
+      canvas.height = img.clientHeight;
+      const ctx = canvas.getContext("2d");
+      ctx.clearRect(0, 0, canvas.width, canvas.height);
+      if (!overlay.size) return;
+      const sx = canvas.width / overlay.size[0];
+      const sy = canvas.height / overlay.size[1];
+      ctx.strokeStyle = "#22c55e";
+      ctx.lineWidth = 2;
+      overlay.objects.forEach(o => ctx.strokeRect(o.x * sx, o.y * sy, o.w * sx, o.h * sy));
+    };
+    this.overlaySource.onerror = () => {
+      // Superposición desactivada en el servidor: no reintentar
+      if (this.overlaySource.readyState === EventSource.CLOSED) this.overlaySource = null;
+    };
+  },
+
   connectLiveConsole() {
     const consoleEl = document.getElementById("live-console");
     if (!consoleEl) return;
@@ -74,22 +125,60 @@ const app = {
       });
   },
 
+  autoFocus() {
+    this.logLive("Autofocus running...");
+    fetch("/api/focus/auto", { method: "POST" })
+      .then(res => res.json())
+      .then(data => {
+        if (data.error) {
+          this.logLive(data.error);
+          return;
+        }
+        const poll = () => {
+          fetch("/api/focus/auto")
+            .then(res => res.json())
+            .then(state => {
+              if (state.status === "running") {
+                setTimeout(poll, 500);
+                return;
+              }
+              if (state.status === "done") {
+                this.focus_step = state.best;
+                document.getElementById("focus-value").textContent = state.best;
+                this.logLive(`Autofocus done: step ${state.best}`);
+                return;
+              }
+              // Cancelado o con error el motor puede no estar en `best`
+              this.logLive(`Autofocus ${state.status}${state.error ? ": " + state.error : ""}`);
+              this.refreshFocus();
+            });
+        };
+        poll();
+      })
+      .catch(err => {
+        this.logLive(`Autofocus error: ${err.message}`);
+      });
+  },
+
   capturePhoto() {
     this.logLive("Capturing photo...");
     fetch("/api/capture/photo")
       .then(res => res.json())
       .then(data => {
-        if (data.status === "ok") {
-          this.logLive(`Photo saved: ${data.file}`);
-          // ✅ Mostrar resumen en consola web
-          if (data.summary) {
-            this.logLive(`Classification summary: ${data.summary}`);
-          } else {
-            this.logLive("No classification summary received");
-          }
-          if (this.currentView === "samples") this.loadSamples();
+        if (data.job) {
+          this.logLive(`Image captured: ${data.file}, processing...`);
+          this.waitForJob(data.job, result => {
+            this.logLive(`Photo saved: ${result.file}`);
+            // ✅ Mostrar resumen en consola web
+            if (result.summary) {
+              this.logLive(`Classification summary: ${result.summary}`);
+            } else {
+              this.logLive("No classification summary received");
+            }
+            if (this.currentView === "samples") this.loadSamples();
+          });
         } else {
-          this.logLive("Capture failed");
+          this.logLive(data.error || "Capture failed");
         }
       })
       .catch(err => {
@@ -97,6 +186,23 @@ const app = {
       });
   },
 
+  waitForJob(jobId, onDone) {
+    fetch(`/api/jobs/${jobId}`)
+      .then(res => res.json())
+      .then(job => {
+        if (job.status === "done") {
+          onDone(job.result);
+        } else if (job.status === "error" || job.error) {
+          this.logLive(`Processing failed: ${job.error}`);
+        } else {
+          setTimeout(() => this.waitForJob(jobId, onDone), 500);
+        }
+      })
+      .catch(err => {
+        this.logLive(`Job error: ${err.message}`);
+      });
+  },
+
   toggleVideo() {
     const btn = document.getElementById("videoBtn");
     const action = this.videoActive ? "stop" : "start";
@@ -256,13 +362,17 @@ const app = {
     });
   },
 
-  init() {
-    fetch("/api/focus/current")
+  refreshFocus() {
+    return fetch("/api/focus/current")
       .then(r => r.json())
       .then(data => {
         this.focus_step = data.step;
         document.getElementById("focus-value").textContent = data.step;
-      })
+      });
+  },
+
+  init() {
+    this.refreshFocus()
       .catch(() => {
         this.focus_step = 100;
         document.getElementById("focus-value").textContent = "100";
@@ -0,0 +1,267 @@
+# stepper.py
+import itertools
+import math
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+# ========== Perfil de velocidad ==========
+# Perfil trapezoidal: arranca a start_speed, acelera con `acceleration`
+# (pasos/s²) hasta max_speed y frena simétricamente al final. Devuelve el
+# periodo de cada paso sin construir la lista completa.
+def step_periods(steps, start_speed, max_speed, acceleration):
+    start_speed = max(1.0, min(start_speed, max_speed))
+    if acceleration <= 0:
+        period = 1.0 / max_speed
+        for _ in range(steps):
+            yield period
+        return
+    v0_sq = start_speed * start_speed
+    for i in range(steps):
+        ramp = min(i, steps - 1 - i)
+        speed = min(max_speed, math.sqrt(v0_sq + 2.0 * acceleration * ramp))
+        yield 1.0 / speed
+
+
+# Espera hasta `deadline` (perf_counter): duerme la mayor parte y termina con
+# una espera activa corta para no depender de la granularidad de sleep(). La
+# espera activa debe ser una fracción pequeña del periodo: si fuese más larga
+# que el periodo el hilo ocuparía un núcleo (y el GIL) todo el movimiento.
+SPIN = 0.0001
+
+
+def wait_until(deadline, spin=SPIN):
+    remaining = deadline - time.perf_counter()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while time.perf_counter() < deadline:
+        pass
+
+
+# ========== Movimientos ==========
+class Move:
+    ids = itertools.count(1)
+
+    def __init__(self, stepper, direction, steps, on_done=None):
+        self.id = next(Move.ids)
+        self.stepper = stepper
+        self.direction = direction
+        self.steps = steps
+        self.steps_done = 0
+        self.status = "queued"
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def wait(self, timeout=None):
+        return self.done_event.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "stepper": self.stepper,
+            "direction": self.direction,
+            "steps": self.steps,
+            "steps_done": self.steps_done,
+            "status": self.status,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+# Un hilo por motor consume su cola de movimientos en orden, así dos motores
+# pueden moverse a la vez pero los movimientos de un mismo motor nunca se
+# solapan. `observe(move)` se llama al terminar cada movimiento, antes de
+# su on_done (para métricas); sus fallos se registran con `log`.
+class MotorWorker:
+    def __init__(self, name, gpio, get_config, observe=None, log=print):
+        self.name = name
+        self.gpio = gpio
+        self.get_config = get_config
+        self.observe = observe
+        self.log = log
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.current = None
+        self.thread = threading.Thread(target=self._run, name=f"stepper-{name}", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, move):
+        with self.cond:
+            self.queue.append(move)
+            self.cond.notify()
+
+    def cancel_all(self):
+        with self.cond:
+            moves = list(self.queue)
+            if self.current is not None:
+                moves.append(self.current)
+        for move in moves:
+            move.cancel()
+        return len(moves)
+
+    def _run(self):
+        # Prioridad de tiempo real si el proceso tiene permisos
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                move = self.queue.popleft()
+                self.current = move
+            # Pase lo que pase el movimiento termina: si el hilo muriese, éste
+            # y los siguientes de este motor quedarían "queued" para siempre
+            try:
+                self._execute(move)
+            except Exception as e:
+                move.status = "error"
+                move.error = str(e)
+                move.finished = time.time()
+            try:
+                with self.cond:
+                    self.current = None
+                if self.observe is not None:
+                    self._callback(move, "observe", self.observe)
+                if move.on_done is not None:
+                    self._callback(move, "on_done", move.on_done)
+            finally:
+                move.done_event.set()
+
+    def _callback(self, move, name, callback):
+        try:
+            callback(move)
+        except Exception as e:
+            self.log(f"Move {move.id} ({self.name}) {name} callback failed: {e}\n{traceback.format_exc()}")
+
+    def _execute(self, move):
+        if move.cancel_event.is_set():
+            move.status = "cancelled"
+            move.finished = time.time()
+            return
+
+        move.status = "running"
+        move.started = time.time()
+        pin_enable = None
+        try:
+            cfg = self.get_config()
+            pin_dir = cfg["dir_pin"]
+            pin_step = cfg["step_pin"]
+            pin_enable = cfg["enable_pin"]
+            start_speed = 1.0 / (2 * cfg.get("delay", 0.0005))
+            max_speed = float(cfg.get("max_speed", start_speed))
+            acceleration = float(cfg.get("acceleration", 0))
+            pulse = min(cfg.get("delay", 0.0005), 0.0005)
+
+            self.gpio.write(pin_enable, False)
+            time.sleep(0.01)
+            self.gpio.write(pin_dir, move.direction == "forward")
+
+            deadline = time.perf_counter()
+            for period in step_periods(move.steps, start_speed, max_speed, acceleration):
+                if move.cancel_event.is_set():
+                    break
+                self.gpio.write(pin_step, True)
+                spin = min(SPIN, period / 10)
+                wait_until(deadline + min(pulse, period / 2), spin)
+                self.gpio.write(pin_step, False)
+                move.steps_done += 1
+                deadline += period
+                wait_until(deadline, spin)
+                # Si el hilo se retrasó (carga), no recuperar pasos de golpe
+                # por encima de la velocidad del perfil: se reprograma desde ahora
+                now = time.perf_counter()
+                if now - deadline > 0.1 * period:
+                    deadline = now
+            move.status = "cancelled" if move.steps_done < move.steps else "done"
+        except Exception as e:
+            move.status = "error"
+            move.error = str(e)
+        finally:
+            if pin_enable is not None:
+                try:
+                    self.gpio.write(pin_enable, True)
+                except Exception:
+                    pass
+            move.finished = time.time()
+
+
+# ========== Motor de pasos ==========
+class StepperEngine:
+    def __init__(self, gpio, get_config, history=100, observe=None, log=print):
+        self.gpio = gpio
+        self.get_config = get_config
+        self.observe = observe
+        self.log = log
+        self.history = history
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.moves = OrderedDict()
+
+    def _worker(self, stepper):
+        with self.lock:
+            worker = self.workers.get(stepper)
+            if worker is None:
+                worker = MotorWorker(stepper, self.gpio, lambda: self.get_config(stepper), self.observe, self.log)
+                self.workers[stepper] = worker
+            return worker
+
+    def move(self, stepper, direction, steps, on_done=None):
+        move = Move(stepper, direction, steps, on_done)
+        with self.lock:
+            self.moves[move.id] = move
+            while len(self.moves) > self.history:
+                oldest = next(iter(self.moves.values()))
+                if not oldest.done_event.is_set():
+                    break
+                self.moves.popitem(last=False)
+        self._worker(stepper).enqueue(move)
+        return move
+
+    def get(self, move_id):
+        with self.lock:
+            return self.moves.get(move_id)
+
+    def cancel(self, move_id):
+        move = self.get(move_id)
+        if move is None:
+            return None
+        move.cancel()
+        return move
+
+    def cancel_all(self, stepper=None):
+        with self.lock:
+            workers = [w for name, w in self.workers.items() if stepper is None or name == stepper]
+        return sum(w.cancel_all() for w in workers)
+
+    # Espera a que terminen (o se descarten) todos los movimientos, p. ej.
+    # tras cancel_all() y antes de liberar los pines
+    def wait_idle(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            pending = [m for m in self.moves.values() if not m.done_event.is_set()]
+        for move in pending:
+            if not move.wait(max(deadline - time.monotonic(), 0)):
+                return False
+        return True
+
+    def busy(self, stepper):
+        with self.lock:
+            worker = self.workers.get(stepper)
+        if worker is None:
+            return False
+        with worker.cond:
+            return worker.current is not None or bool(worker.queue)
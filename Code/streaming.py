@@ -0,0 +1,298 @@
+# streaming.py
+import threading
+import time
+from collections import deque
+
+# El encoder de Picamera2 sólo acepta subclases de su Output. Sin Picamera2
+# (simulación, tests) basta con la misma interfaz.
+try:
+    from picamera2.outputs import Output
+except ImportError:
+    class Output:
+        def __init__(self, pts=None):
+            self.recording = False
+            self.ptsoutput = pts
+            self.needs_pacing = False
+            self.needs_add_stream = False
+
+        def start(self):
+            self.recording = True
+
+        def stop(self):
+            self.recording = False
+
+        def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+            pass
+
+
+# ========== Difusor de frames ==========
+# Un único hilo productor captura y codifica cada frame una sola vez y lo deja
+# en una ranura "último frame"; cada cliente espera en la condición y sólo
+# recibe el frame más reciente, así que un cliente lento salta frames en vez
+# de frenar al productor o a los demás clientes.
+class FrameBroadcaster:
+    def __init__(self, produce_frame, max_fps=20.0, idle_timeout=2.0):
+        self.produce_frame = produce_frame
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.subscribers = 0
+        self.dropped = 0
+        self.thread = None
+        self.last_error = None
+
+    def _run(self):
+        idle_since = None
+        while True:
+            with self.cond:
+                if self.subscribers == 0:
+                    if idle_since is None:
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since > self.idle_timeout:
+                        self.thread = None
+                        return
+                else:
+                    idle_since = None
+
+            started = time.monotonic()
+            try:
+                frame = self.produce_frame()
+                self.last_error = None
+            except Exception as e:
+                frame = None
+                self.last_error = e
+
+            if frame is not None:
+                with self.cond:
+                    self.frame = frame
+                    self.seq += 1
+                    self.cond.notify_all()
+
+            elapsed = time.monotonic() - started
+            if elapsed < self.min_interval:
+                time.sleep(self.min_interval - elapsed)
+            elif frame is None:
+                time.sleep(0.1)
+
+    def _ensure_running(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="frame-broadcaster", daemon=True)
+            self.thread.start()
+
+    def wait_frame(self, last_seq, timeout=5.0):
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != last_seq, timeout=timeout)
+            return self.seq, self.frame
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+            self._ensure_running()
+            last_seq = self.seq
+        try:
+            while True:
+                seq, frame = self.wait_frame(last_seq)
+                if seq == last_seq or frame is None:
+                    continue
+                # Frames que este cliente se saltó por ir más lento que el productor
+                if seq - last_seq > 1:
+                    with self.cond:
+                        self.dropped += seq - last_seq - 1
+                last_seq = seq
+                yield frame
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+
+    def client_count(self):
+        with self.cond:
+            return self.subscribers
+
+    def stats(self):
+        with self.cond:
+            return {"clients": self.subscribers, "frames": self.seq, "dropped": self.dropped}
+
+
+# ========== Perfiles de stream ==========
+# Cada cliente pide ancho, calidad JPEG y fps máximos (parámetros de
+# /video_feed); se ajustan hacia abajo a los valores permitidos en la
+# configuración, así los clientes con peticiones parecidas comparten la misma
+# variante codificada. Un perfil es la tupla (ancho, calidad, fps).
+def snap_down(value, allowed):
+    below = [a for a in allowed if a <= value]
+    return max(below) if below else min(allowed)
+
+
+def negotiate_profile(args, options):
+    default = options["default"]
+    width = snap_down(int(args.get("width", default["width"])), options["widths"])
+    quality = snap_down(int(args.get("quality", default["quality"])), options["qualities"])
+    fps = snap_down(float(args.get("fps", default["fps"])), options["fps"])
+    return width, quality, fps
+
+
+# Último frame capturado, compartido por todas las variantes: como mucho una
+# captura cada 1/max_fps segundos sea cual sea el número de variantes
+class FrameSource:
+    def __init__(self, capture, max_fps=20.0):
+        self.capture = capture
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.lock = threading.Lock()
+        self.frame = None
+        self.captured = 0.0
+
+    def latest(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.frame is None or now - self.captured >= self.min_interval:
+                self.frame = self.capture()
+                self.captured = now
+            return self.frame
+
+
+# ========== Variantes MJPEG ==========
+# Un FrameBroadcaster por perfil: cada variante se codifica una sola vez por
+# frame para todos sus clientes y su hilo termina cuando se queda sin ellos.
+# Con adaptive=True la calidad de cada cliente baja un escalón (a la variante
+# vecina) cuando enviar un frame tarda más que el intervalo entre frames
+# (el servidor WSGI no pide el siguiente trozo hasta haber escrito el
+# anterior en el socket) y vuelve a subir hacia la pedida cuando los envíos
+# son holgados.
+class StreamHub:
+    def __init__(self, encode, qualities, adaptive=True, slow_frames=3, fast_frames=40):
+        self.encode = encode
+        self.qualities = sorted(qualities, reverse=True)
+        self.adaptive = adaptive
+        self.slow_frames = slow_frames
+        self.fast_frames = fast_frames
+        self.lock = threading.Lock()
+        self.variants = {}
+        self.downgrades = 0
+
+    def variant(self, profile):
+        with self.lock:
+            broadcaster = self.variants.get(profile)
+            if broadcaster is None:
+                width, quality, fps = profile
+                broadcaster = FrameBroadcaster(lambda: self.encode(width, quality), max_fps=fps)
+                self.variants[profile] = broadcaster
+            return broadcaster
+
+    def stream(self, profile):
+        width, quality, fps = profile
+        levels = [q for q in self.qualities if q <= quality] or [quality]
+        level = 0
+        budget = 1.0 / fps
+        while True:
+            frames = self.variant((width, levels[level], fps)).subscribe()
+            slow = fast = 0
+            try:
+                for frame in frames:
+                    started = time.monotonic()
+                    yield frame
+                    if not self.adaptive:
+                        continue
+                    elapsed = time.monotonic() - started
+                    if elapsed > budget:
+                        slow, fast = slow + 1, 0
+                    elif elapsed < budget / 4:
+                        slow, fast = 0, fast + 1
+                    if slow >= self.slow_frames and level + 1 < len(levels):
+                        level += 1
+                        with self.lock:
+                            self.downgrades += 1
+                        break
+                    if fast >= self.fast_frames and level > 0:
+                        level -= 1
+                        break
+            finally:
+                frames.close()
+
+    def stats(self):
+        with self.lock:
+            variants = list(self.variants.items())
+            downgrades = self.downgrades
+        totals = {"clients": 0, "frames": 0, "dropped": 0, "downgrades": downgrades, "variants": []}
+        for (width, quality, fps), broadcaster in variants:
+            stats = broadcaster.stats()
+            for key in ("clients", "frames", "dropped"):
+                totals[key] += stats[key]
+            if stats["clients"]:
+                totals["variants"].append({"width": width, "quality": quality, "fps": fps, "clients": stats["clients"]})
+        return totals
+
+
+# ========== Relé H.264 ==========
+# Reenvía sin recodificar el H.264 del encoder hardware de la cámara (Annex B
+# con cabeceras repetidas en cada keyframe). Hace de "output" del encoder de
+# Picamera2 (subclase de su Output); el encoder se arranca con el primer
+# cliente y se para con el último. Cada cliente entra en el siguiente
+# keyframe y tiene una cola acotada: si se llena, el cliente no da abasto y
+# se vacía para continuar desde el siguiente keyframe en vez de acumular
+# retraso.
+class H264Relay(Output):
+    def __init__(self, start_encoder, stop_encoder, max_queue=30):
+        super().__init__()
+        self.start_encoder = start_encoder
+        self.stop_encoder = stop_encoder
+        self.max_queue = max_queue
+        self.cond = threading.Condition()
+        self.clients = []
+        self.dropped = 0
+        self.encoder_lock = threading.Lock()
+        self.encoding = False
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        # Sólo se reenvía vídeo
+        if audio or frame is None:
+            return
+        data = bytes(frame)
+        with self.cond:
+            for client in self.clients:
+                if client["waiting"] and not keyframe:
+                    continue
+                if len(client["queue"]) >= self.max_queue:
+                    client["queue"].clear()
+                    client["waiting"] = True
+                    self.dropped += 1
+                    continue
+                client["waiting"] = False
+                client["queue"].append(data)
+            self.cond.notify_all()
+
+    # Arranca o para el encoder según haya clientes; serializado para que un
+    # cliente que llega mientras se va el último no se quede sin encoder
+    def _sync_encoder(self):
+        with self.encoder_lock:
+            with self.cond:
+                wanted = bool(self.clients)
+            if wanted and not self.encoding:
+                self.start_encoder(self)
+                self.encoding = True
+            elif not wanted and self.encoding:
+                self.encoding = False
+                self.stop_encoder()
+
+    def subscribe(self):
+        client = {"queue": deque(), "waiting": True}
+        with self.cond:
+            self.clients.append(client)
+        try:
+            self._sync_encoder()
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: client["queue"], timeout=5.0)
+                    chunks = list(client["queue"])
+                    client["queue"].clear()
+                if chunks:
+                    yield b"".join(chunks)
+        finally:
+            with self.cond:
+                self.clients.remove(client)
+            self._sync_encoder()
+
+    def client_count(self):
+        with self.cond:
+            return len(self.clients)
@@ -0,0 +1,8 @@
+# conftest.py
+import os
+import sys
+
+# Los módulos de la aplicación se importan por nombre desde Code/
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(CODE_DIR, "samples")
+sys.path.insert(0, CODE_DIR)
@@ -0,0 +1,40 @@
+# test_archive.py
+import io
+import os
+import zipfile
+import pytest
+from archive import Entry, StreamingZip
+
+
+def rows():
+    for i in range(3000):
+        yield f"sample_{i},{i}\n".encode("utf-8")
+
+
+def test_chunked_entry_in_streaming_zip(tmp_path):
+    path = tmp_path / "photo_1.jpg"
+    path.write_bytes(b"\xff\xd8" + os.urandom(5000))
+    st = os.stat(path)
+    entries = [
+        Entry("photo_1.jpg", st.st_size, st.st_mtime, path=str(path)),
+        Entry.from_chunks("manifest.csv", rows)
+    ]
+    archive = StreamingZip(entries)
+    data = b"".join(archive.iter_range())
+    assert len(data) == archive.size
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.testzip() is None
+        assert z.read("photo_1.jpg") == path.read_bytes()
+        assert z.read("manifest.csv") == b"".join(rows())
+
+    # Reanudar a mitad del manifest da los mismos bytes
+    middle = archive.size - 20000
+    assert b"".join(archive.iter_range(0, middle)) + b"".join(archive.iter_range(middle)) == data
+
+
+def test_chunked_entry_detects_changes():
+    content = [b"a" * 100]
+    entry = Entry.from_chunks("manifest.csv", lambda: iter(content))
+    content[0] = b"a" * 50
+    with pytest.raises(IOError):
+        b"".join(entry.read())
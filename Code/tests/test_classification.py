@@ -0,0 +1,57 @@
+# test_classification.py
+import random
+import numpy as np
+import classification
+from classification import ResultCache, classify_batch
+
+
+def test_identical_crops_in_one_batch_are_classified_once(monkeypatch):
+    calls = []
+
+    def fake_batch(crops):
+        calls.append(len(crops))
+        return [{"label": "copepod", "confidence": 80.0} for _ in crops]
+
+    monkeypatch.setattr(classification, "CLASSIFIER_AVAILABLE", True)
+    monkeypatch.setattr(classification, "native_classify_batch", fake_batch)
+    rng = np.random.default_rng(0)
+    crop = rng.integers(0, 255, (24, 24, 3), dtype=np.uint8)
+    other = rng.integers(0, 255, (24, 24, 3), dtype=np.uint8)
+    cache = ResultCache()
+
+    results = classify_batch([crop, crop.copy(), other, crop.copy()], cache=cache)
+    assert calls == [2]
+    assert [r["label"] for r in results] == ["copepod"] * 4
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+    classify_batch([crop], cache=cache)
+    assert calls == [2]
+    assert cache.stats()["hits"] == 3
+
+
+# El índice por bandas encuentra lo mismo que recorrer toda la caché
+def test_near_match_index_matches_linear_scan():
+    rng = random.Random(1)
+    cache = ResultCache(size=1000, ttl=60.0, threshold=4)
+    stored = []
+    for i in range(300):
+        key = ("v", rng.randint(8, 9), rng.getrandbits(64))
+        cache.store(key, {"label": str(i), "confidence": 1.0}, 0.0)
+        stored.append(key)
+    for _ in range(500):
+        version, bucket, value = rng.choice(stored)
+        for bit in rng.sample(range(64), rng.randint(0, 6)):
+            value ^= 1 << bit
+        probe = (version, bucket, value)
+        expected = any(cache.similar(key, probe) for key in stored)
+        assert (cache.lookup(probe, 1.0) is not None) == expected
+
+
+def test_evicted_entries_leave_the_index():
+    cache = ResultCache(size=2, ttl=60.0, threshold=4)
+    values = (0, (1 << 64) - 1, 0x5555555555555555)
+    for value in values:
+        cache.store(("v", 8, value), {"label": "x", "confidence": 1.0}, 0.0)
+    assert cache.lookup(("v", 8, values[0]), 1.0) is None
+    assert all(keys <= set(cache.entries) for keys in cache.index.values())
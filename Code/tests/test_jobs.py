@@ -0,0 +1,29 @@
+# test_jobs.py
+import threading
+from jobs import JobQueue
+
+
+def square(x):
+    return x * x
+
+
+# Un on_done que falla se registra y queda marcado en el trabajo
+def test_failing_callback_is_logged_and_recorded():
+    logs = []
+    logged = threading.Event()
+    queue = JobQueue(max_workers=1, max_pending=2, log=lambda msg: (logs.append(msg), logged.set()))
+
+    def on_done(job):
+        raise ValueError("boom")
+
+    try:
+        job_id = queue.submit("test", square, 3, on_done=on_done)
+        assert logged.wait(10.0)
+        job = queue.get(job_id)
+        assert job["status"] == "done"
+        assert job["result"] == 9
+        assert job["callback_error"] == "on_done: boom"
+        assert queue.stats()["callback_errors"] == 1
+        assert "ValueError: boom" in logs[0]
+    finally:
+        queue.shutdown()
@@ -0,0 +1,70 @@
+# test_segmentation.py
+import math
+import os
+import cv2
+import numpy as np
+import pytest
+from conftest import SAMPLES_DIR
+from segmentation import segment_objects, segment_tiled, threshold_mask, StageTimer
+
+FIXTURE = os.path.join(SAMPLES_DIR, "photo_1764875671.jpg")
+
+
+# Selección original: contornos externos filtrados por contourArea
+def reference_boxes(bgr_frame, min_area_frac=0.0005, max_area_frac=0.01):
+    H, W = bgr_frame.shape[:2]
+    gray = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2GRAY)
+    mask = threshold_mask(gray, StageTimer(None))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for c in contours:
+        area = cv2.contourArea(c)
+        if min_area_frac * H * W <= area <= max_area_frac * H * W and cv2.arcLength(c, True) > 0:
+            boxes.append(cv2.boundingRect(c))
+    return sorted(boxes)
+
+
+def boxes(objects):
+    return sorted((o["x"], o["y"], o["w"], o["h"]) for o in objects)
+
+
+def test_fixture_object_count():
+    frame = cv2.imread(FIXTURE)
+    assert frame is not None
+    assert len(segment_objects(frame)) == 5
+
+
+@pytest.mark.parametrize("name", sorted(n for n in os.listdir(SAMPLES_DIR) if n.startswith("photo_") and n.endswith(".jpg")))
+def test_selection_matches_contour_area(name):
+    frame = cv2.imread(os.path.join(SAMPLES_DIR, name))
+    assert boxes(segment_objects(frame)) == reference_boxes(frame)
+
+
+# Con el CLAHE sobre el frame completo las costuras no cambian nada: mismas
+# cajas y medidas que sin teselas
+@pytest.mark.parametrize("tile_size,overlap", [(128, 32), (256, 64)])
+def test_tiled_matches_whole_frame(tile_size, overlap):
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if not (name.startswith("photo_") and name.endswith(".jpg")):
+            continue
+        frame = cv2.imread(os.path.join(SAMPLES_DIR, name))
+        H, W = frame.shape[:2]
+        whole = sorted(segment_objects(frame), key=lambda o: (o["x"], o["y"]))
+        tiled = sorted(segment_tiled(frame, tile_size=tile_size, overlap=overlap, min_area=0.0005 * H * W),
+                       key=lambda o: (o["x"], o["y"]))
+        assert boxes(tiled) == boxes(whole)
+        for a, b in zip(whole, tiled):
+            assert a == pytest.approx(b)
+
+
+def test_area_filter_uses_contour_area():
+    # Anillo: el contorno externo encierra el hueco, así que su área de
+    # contorno supera a su número de píxeles
+    frame = np.full((200, 200, 3), 230, dtype=np.uint8)
+    cv2.circle(frame, (100, 100), 30, (20, 20, 20), 6)
+    H, W = frame.shape[:2]
+    contour_area = math.pi * 33 ** 2
+    pixel_area = math.pi * (33 ** 2 - 27 ** 2)
+    # Umbral mínimo entre ambas áreas: con el número de píxeles se perdería
+    min_frac = (pixel_area + contour_area) / 2 / (H * W)
+    assert len(segment_objects(frame, min_area_frac=min_frac, max_area_frac=1.0)) == 1
@@ -0,0 +1,29 @@
+# test_stepper.py
+from hardware import FakeGPIOBackend
+from stepper import StepperEngine
+
+CONFIG = {"dir_pin": 26, "step_pin": 19, "enable_pin": 9, "delay": 0.0005, "max_speed": 2000, "acceleration": 4000}
+
+
+def test_move_counts_step_edges():
+    gpio = FakeGPIOBackend()
+    engine = StepperEngine(gpio, lambda key: CONFIG)
+    move = engine.move("stepper1", "forward", 20)
+    assert move.wait(2.0)
+    assert move.status == "done"
+    assert len(gpio.edges(CONFIG["step_pin"])) == 20
+
+
+# Una configuración inválida marca el movimiento como error sin matar el
+# hilo del motor: los siguientes movimientos siguen ejecutándose
+def test_bad_config_fails_move_and_keeps_worker():
+    gpio = FakeGPIOBackend()
+    configs = [dict(CONFIG, delay=0), CONFIG]
+    engine = StepperEngine(gpio, lambda key: configs[0])
+    failed = engine.move("stepper1", "forward", 5)
+    assert failed.wait(2.0)
+    assert failed.status == "error"
+    configs.pop(0)
+    move = engine.move("stepper1", "forward", 5)
+    assert move.wait(2.0)
+    assert move.status == "done"
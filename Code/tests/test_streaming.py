@@ -0,0 +1,47 @@
+# test_streaming.py
+import pytest
+from streaming import H264Relay
+
+
+def first_chunk(emit):
+    relay = H264Relay(emit, lambda: None)
+    stream = relay.subscribe()
+    try:
+        return next(stream)
+    finally:
+        stream.close()
+
+
+# Un cliente nuevo entra en el siguiente keyframe; el audio no se reenvía
+def test_client_starts_at_keyframe():
+    def emit(relay):
+        relay.outputframe(b"delta0", False)
+        relay.outputframe(b"key", True, 0, None, False)
+        relay.outputframe(b"aac", True, 1, None, True)
+        relay.outputframe(None, True, 2, b"aac", True)
+        relay.outputframe(b"delta1", keyframe=False, timestamp=3)
+    assert first_chunk(emit) == b"keydelta1"
+
+
+def test_encoder_follows_clients():
+    calls = []
+    relay = H264Relay(lambda r: (calls.append("start"), r.outputframe(b"key", True)), lambda: calls.append("stop"))
+    stream = relay.subscribe()
+    assert next(stream) == b"key"
+    assert relay.client_count() == 1
+    stream.close()
+    assert calls == ["start", "stop"]
+    assert relay.client_count() == 0
+
+
+# Contrato real: el encoder de Picamera2 rechaza lo que no sea un Output y
+# llama a outputframe con sus cinco argumentos posicionales
+def test_picamera2_encoder_accepts_relay():
+    encoders = pytest.importorskip("picamera2.encoders")
+    encoder = encoders.Encoder()
+
+    def emit(relay):
+        encoder.output = relay
+        encoder.outputframe(b"key", keyframe=True, timestamp=0)
+        encoder.outputframe(b"delta", keyframe=False, timestamp=1)
+    assert first_chunk(emit) == b"keydelta"
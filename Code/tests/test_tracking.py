@@ -0,0 +1,55 @@
+# test_tracking.py
+from tracking import SequenceTracker
+
+
+def obj(x, y, w=20, h=20, sharpness=1.0):
+    return {"x": x, "y": y, "w": w, "h": h, "sharpness": sharpness, "area": w * h}
+
+
+def run(frames, flow, order=None):
+    reports = []
+    tracker = SequenceTracker(1, flow=flow, on_report=lambda t, r: reports.append(r))
+    for index in order or range(len(frames)):
+        tracker.frame(index, frames[index])
+    tracker.finish()
+    return tracker, reports[0]
+
+
+# La bomba desplaza 200 px por frame: el organismo A pasa de y=100 a y=300 y
+# uno nuevo, B, aparece donde estaba A. B no debe heredar la pista de A.
+def test_new_organism_near_previous_position_is_a_new_track():
+    frames = [[obj(100, 100)], [obj(100, 300), obj(110, 110)]]
+    tracker, report = run(frames, flow=(0.0, 200.0))
+    assert report["tracks"] == 2
+    sightings = sorted((t.first, t.sightings) for t in tracker.closed)
+    assert sightings == [(0, 2), (1, 1)]
+
+
+def test_out_of_order_frames_are_tracked_in_order():
+    frames = [[obj(100, 100 + 200 * i)] for i in range(4)]
+    tracker, report = run(frames, flow=(0.0, 200.0), order=(2, 0, 3, 1))
+    assert report["tracks"] == 1
+    assert report["class_count"] == {"unknown": 1}
+    assert tracker.closed[0].sightings == 4
+
+
+# Cada aparición recibe la etiqueta de su organismo una vez clasificado
+def test_labeled_frames_carry_track_classification():
+    reports = []
+    tracker = SequenceTracker(
+        1, flow=(0.0, 200.0),
+        classify=lambda crops, done: done([{"label": f"class{i}", "confidence": 90.0} for i in range(len(crops))]),
+        on_report=lambda t, r: reports.append(r)
+    )
+    frames = [[obj(100, 100)], [obj(100, 300), obj(110, 110)]]
+    for index, objects in enumerate(frames):
+        tracker.frame(index, objects, ["crop"] * len(objects))
+    tracker.finish()
+    assert reports
+    labels = {t.id: t.label for t in tracker.closed}
+    labeled = list(tracker.labeled_frames())
+    assert [index for index, _, _ in labeled] == [0, 1]
+    first, second = labeled[0][2], labeled[1][2]
+    assert first[0]["label"] == second[0]["label"] == labels[first[0]["track"]]
+    assert second[1]["label"] == labels[second[1]["track"]] != first[0]["label"]
+    assert all(c["label"].startswith("class") for _, _, cls in labeled for c in cls)
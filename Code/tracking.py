@@ -0,0 +1,281 @@
+# tracking.py
+import csv
+import threading
+
+# ========== Seguimiento entre frames de una adquisición ==========
+# Entre dos frames la bomba avanza `steps` pasos y el líquido arrastra los
+# organismos una distancia proporcional: la predicción de cada pista es su
+# última posición desplazada por `flow` píxeles por frame. `flow` parte de
+# la calibración (px_per_step * pasos por frame) y se corrige con la mediana
+# de los desplazamientos emparejados. Los resultados de los trabajos llegan
+# desordenados, así que los frames se reordenan por índice antes de asociar.
+# Cuando una pista deja de verse `max_gap` frames se cierra y su recorte más
+# enfocado se clasifica: una clasificación por organismo, no por aparición.
+# Cada objeto de cada frame guarda el id de su pista ("track"), así que con
+# el informe cada aparición recibe la etiqueta de su organismo.
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class TrackedObject:
+    def __init__(self, track_id, index, obj, crop):
+        self.id = track_id
+        self.first = index
+        self.last = index
+        self.sightings = 1
+        self.box = (obj["x"], obj["y"], obj["w"], obj["h"])
+        self.best_frame = index
+        self.best_box = self.box
+        self.best_sharpness = obj["sharpness"]
+        self.best_area = obj["area"]
+        self.crop = crop
+        self.label = None
+        self.confidence = 0.0
+
+    def center(self):
+        x, y, w, h = self.box
+        return x + w / 2, y + h / 2
+
+    def predicted(self, index, flow):
+        gap = index - self.last
+        x, y, w, h = self.box
+        return x + flow[0] * gap, y + flow[1] * gap, w, h
+
+    def update(self, index, obj, crop):
+        self.last = index
+        self.sightings += 1
+        self.box = (obj["x"], obj["y"], obj["w"], obj["h"])
+        if obj["sharpness"] > self.best_sharpness:
+            self.best_frame = index
+            self.best_box = self.box
+            self.best_sharpness = obj["sharpness"]
+            self.best_area = obj["area"]
+            self.crop = crop
+
+
+class SequenceTracker:
+    # Un objeto puede pertenecer a una pista si su centro está a menos de
+    # `gate` veces el tamaño de la pista (o `search` píxeles, lo que sea mayor)
+    # de la posición prevista, o si las cajas se solapan con IoU >= min_iou
+    def __init__(self, run_id, flow=(0.0, 0.0), max_gap=1, gate=1.5, search=50, min_iou=0.1,
+                 classify=None, on_report=None):
+        self.run_id = run_id
+        self.flow = tuple(flow)
+        self.max_gap = max_gap
+        self.gate = gate
+        self.search = search
+        self.min_iou = min_iou
+        self.classify = classify
+        self.on_report = on_report
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.buffer = {}
+        self.frame_objects = {}
+        self.open = []
+        self.closed = []
+        self.next_id = 1
+        self.classifying = 0
+        self.frames = 0
+        self.lost_frames = 0
+        self.finishing = False
+        self.volume_ml = None
+        self.report = None
+
+    # Resultado de un frame (lista de objetos con "sharpness" y "area", más
+    # sus recortes) o None si el frame se perdió
+    def frame(self, index, objects, crops=None):
+        with self.lock:
+            self.buffer[index] = (objects, crops)
+            ready = []
+            while self.next_index in self.buffer:
+                ready.append((self.next_index, self.buffer.pop(self.next_index)))
+                self.next_index += 1
+            closing = []
+            for i, (objs, cr) in ready:
+                closing += self._associate(i, objs, cr)
+        self._classify(closing)
+
+    def _associate(self, index, objects, crops):
+        if objects is None:
+            self.lost_frames += 1
+            return []
+        self.frames += 1
+        self.frame_objects[index] = objects
+        closing = [t for t in self.open if index - t.last > self.max_gap]
+        self.open = [t for t in self.open if index - t.last <= self.max_gap]
+
+        pairs = []
+        for ti, track in enumerate(self.open):
+            pred = track.predicted(index, self.flow)
+            pcx, pcy = pred[0] + pred[2] / 2, pred[1] + pred[3] / 2
+            size = max(pred[2], pred[3], 1)
+            reach = max(self.gate * size, self.search)
+            for oi, obj in enumerate(objects):
+                box = (obj["x"], obj["y"], obj["w"], obj["h"])
+                distance = ((box[0] + box[2] / 2 - pcx) ** 2 + (box[1] + box[3] / 2 - pcy) ** 2) ** 0.5
+                if distance <= reach or iou(pred, box) >= self.min_iou:
+                    pairs.append((distance / size, ti, oi))
+        pairs.sort()
+
+        used_tracks = set()
+        used_objects = set()
+        moves = []
+        for _, ti, oi in pairs:
+            if ti in used_tracks or oi in used_objects:
+                continue
+            used_tracks.add(ti)
+            used_objects.add(oi)
+            track = self.open[ti]
+            objects[oi]["track"] = track.id
+            gap = index - track.last
+            cx, cy = track.center()
+            track.update(index, objects[oi], crops[oi] if crops else None)
+            nx, ny = track.center()
+            moves.append(((nx - cx) / gap, (ny - cy) / gap))
+        for oi, obj in enumerate(objects):
+            if oi not in used_objects:
+                obj["track"] = self.next_id
+                self.open.append(TrackedObject(self.next_id, index, obj, crops[oi] if crops else None))
+                self.next_id += 1
+
+        # Corrección del flujo con la mediana de los desplazamientos
+        if len(moves) >= 3:
+            mx = sorted(m[0] for m in moves)[len(moves) // 2]
+            my = sorted(m[1] for m in moves)[len(moves) // 2]
+            self.flow = (0.5 * self.flow[0] + 0.5 * mx, 0.5 * self.flow[1] + 0.5 * my)
+        return closing
+
+    # Clasifica por lotes los recortes más enfocados de las pistas cerradas
+    def _classify(self, tracks):
+        if not tracks:
+            return
+        with self.lock:
+            self.closed += tracks
+            pending = [t for t in tracks if t.crop is not None and self.classify is not None]
+            for track in tracks:
+                if track not in pending:
+                    track.label = "unknown"
+                    track.crop = None
+            if pending:
+                self.classifying += 1
+        if not pending:
+            self._maybe_report()
+            return
+        crops = [t.crop for t in pending]
+        self.classify(crops, lambda results: self._on_classified(pending, results))
+
+    def _on_classified(self, tracks, results):
+        results = results or []
+        with self.lock:
+            for i, track in enumerate(tracks):
+                result = results[i] if i < len(results) else {"label": "unknown", "confidence": 0.0}
+                track.label = result["label"]
+                track.confidence = result["confidence"]
+                track.crop = None
+            self.classifying -= 1
+        self._maybe_report()
+
+    # Fin de la adquisición: se procesan los frames que queden (los huecos son
+    # frames perdidos), se cierran todas las pistas y, cuando terminan sus
+    # clasificaciones, se genera el informe
+    def finish(self, volume_ml=None):
+        with self.lock:
+            if self.finishing:
+                return
+            self.finishing = True
+            self.volume_ml = volume_ml
+            closing = []
+            for index in sorted(self.buffer):
+                objects, crops = self.buffer.pop(index)
+                closing += self._associate(index, objects, crops)
+            closing += self.open
+            self.open = []
+        if closing:
+            self._classify(closing)
+        else:
+            self._maybe_report()
+
+    def _maybe_report(self):
+        with self.lock:
+            if not self.finishing or self.classifying or self.report is not None:
+                return
+            self.report = self._build_report()
+            report = self.report
+        if self.on_report is not None:
+            self.on_report(self, report)
+
+    def counts(self):
+        class_count = {}
+        for track in self.closed:
+            if track.label is not None:
+                class_count[track.label] = class_count.get(track.label, 0) + 1
+        return class_count
+
+    def _build_report(self):
+        class_count = self.counts()
+        volume = self.volume_ml if self.volume_ml else None
+        return {
+            "run": self.run_id,
+            "tracks": len(self.closed),
+            "frames": self.frames,
+            "lost_frames": self.lost_frames,
+            "class_count": class_count,
+            "volume_ml": volume,
+            "concentration_per_ml": {k: round(v / volume, 3) for k, v in class_count.items()} if volume else None,
+            "total_per_ml": round(len(self.closed) / volume, 3) if volume else None,
+            "flow": [round(self.flow[0], 2), round(self.flow[1], 2)]
+        }
+
+    # (índice, objetos, clasificaciones) de cada frame procesado, con la
+    # etiqueta de la pista de cada objeto. Tras el informe, cuando todas las
+    # pistas están clasificadas.
+    def labeled_frames(self):
+        with self.lock:
+            labels = {t.id: (t.label, t.confidence) for t in self.closed}
+            frames = sorted(self.frame_objects.items())
+        for index, objects in frames:
+            classifications = []
+            for obj in objects:
+                label, confidence = labels.get(obj["track"], ("unknown", 0.0))
+                classifications.append({"x": obj["x"], "y": obj["y"], "w": obj["w"], "h": obj["h"],
+                                        "label": label, "confidence": confidence, "track": obj["track"]})
+            yield index, objects, classifications
+
+    def write_tracks(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["track", "first_frame", "last_frame", "sightings", "best_frame",
+                             "x", "y", "w", "h", "area", "sharpness", "label", "confidence"])
+            for t in sorted(self.closed, key=lambda t: t.id):
+                x, y, w, h = t.best_box
+                writer.writerow([t.id, t.first + 1, t.last + 1, t.sightings, t.best_frame + 1,
+                                 x, y, w, h, f"{t.best_area:.6g}", f"{t.best_sharpness:.6g}",
+                                 t.label, t.confidence])
+
+    def write_counts(self, path, report):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["label", "count", "per_ml"])
+            per_ml = report["concentration_per_ml"] or {}
+            for label, count in sorted(report["class_count"].items()):
+                writer.writerow([label, count, per_ml.get(label, "")])
+            total = report["total_per_ml"]
+            writer.writerow(["total", report["tracks"], "" if total is None else total])
+
+    def status(self):
+        with self.lock:
+            return {
+                "tracks_open": len(self.open),
+                "tracks_closed": len(self.closed),
+                "classifying": self.classifying,
+                "class_count": self.counts(),
+                "flow": [round(self.flow[0], 2), round(self.flow[1], 2)],
+                "report": self.report
+            }
@@ -0,0 +1,229 @@
+# video_analysis.py
+import csv
+import functools
+import os
+import threading
+import time
+import zipfile
+import cv2
+from segmentation import FEATURE_COLUMNS
+
+
+# Generador de frames: sólo hay un frame decodificado a la vez en memoria
+def iter_frames(path, step=1):
+    cap = cv2.VideoCapture(path)
+    try:
+        index = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if index % step == 0:
+                yield index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # Los .h264 sin contenedor no tienen número de frames fiable
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        return fps, max(total, 0)
+    finally:
+        cap.release()
+
+
+# ========== Análisis de grabaciones ==========
+# Un hilo decodifica la grabación y envía cada `step` frames al pool con
+# submit(frame, index, on_done); la cola acotada del pool limita los frames en
+# vuelo. Los resultados llegan desordenados y se escriben según llegan en
+# <video>_objects.csv (una fila por objeto) y sus miniaturas en
+# <video>_objects.zip. El progreso se publica en la consola cada
+# `progress_interval` segundos.
+class VideoAnalysis:
+    def __init__(self, samples_dir, submit, log, on_finished=None, progress_interval=5.0):
+        self.samples_dir = samples_dir
+        self.submit = submit
+        self.log = log
+        self.on_finished = on_finished
+        self.progress_interval = progress_interval
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.writer = None
+        self.csv_file = None
+        self.archive = None
+        self.last_report = 0.0
+        self.state = self._empty_state("idle")
+
+    def _empty_state(self, status):
+        return {
+            "status": status,
+            "file": None,
+            "step": 1,
+            "frames_total": 0,
+            "frames_submitted": 0,
+            "frames_processed": 0,
+            "frames_failed": 0,
+            "objects": 0,
+            "class_count": {},
+            "started": None,
+            "finished": None,
+            "decoded": False,
+            "outputs": [],
+            "error": None
+        }
+
+    def running(self):
+        with self.lock:
+            return self.state["status"] in ("running", "stopping")
+
+    def start(self, filename, step=1):
+        path = os.path.join(self.samples_dir, filename)
+        info = video_info(path)
+        if info is None:
+            raise ValueError(f"Cannot open video: {filename}")
+        fps, total = info
+        stem = os.path.splitext(filename)[0]
+        csv_name = f"{stem}_objects.csv"
+        zip_name = f"{stem}_objects.zip"
+        with self.lock:
+            if self.state["status"] in ("running", "stopping"):
+                return False
+            self.stop_event.clear()
+            self.state = self._empty_state("running")
+            self.state.update({
+                "file": filename,
+                "step": step,
+                "fps": fps,
+                "frames_total": (total + step - 1) // step if total else 0,
+                "started": time.time(),
+                "outputs": [csv_name, zip_name]
+            })
+            self.csv_file = open(os.path.join(self.samples_dir, csv_name), "w", newline="")
+            self.writer = csv.writer(self.csv_file)
+            self.writer.writerow(["frame", "time", "object", "x", "y", "w", "h"] + FEATURE_COLUMNS + ["label", "confidence", "thumbnail"])
+            self.archive = zipfile.ZipFile(os.path.join(self.samples_dir, zip_name), "w", zipfile.ZIP_STORED)
+            self.thread = threading.Thread(target=self._run, args=(path, step, fps), name="video-analysis", daemon=True)
+            self.thread.start()
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.state["status"] != "running":
+                return False
+            self.state["status"] = "stopping"
+        self.stop_event.set()
+        return True
+
+    def _run(self, path, step, fps):
+        name = os.path.basename(path)
+        self.log(f"Video analysis started: {name} (1 frame out of {step})")
+        self.last_report = time.monotonic()
+        try:
+            for index, frame in iter_frames(path, step):
+                if self.stop_event.is_set():
+                    break
+                submitted = False
+                while not submitted and not self.stop_event.is_set():
+                    submitted = self.submit(frame, index, functools.partial(self._on_processed, fps))
+                if not submitted:
+                    break
+                with self.lock:
+                    self.state["frames_submitted"] += 1
+                self._maybe_report()
+        except Exception as e:
+            with self.lock:
+                self.state["error"] = str(e)
+            self.log(f"Video analysis error: {e}")
+        with self.lock:
+            self.state["decoded"] = True
+        self._maybe_finish()
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_report < self.progress_interval:
+                return
+            self.last_report = now
+            state = self.state
+            elapsed = time.time() - state["started"]
+            rate = state["frames_processed"] / elapsed if elapsed > 0 else 0.0
+            total = state["frames_total"] or "?"
+            message = (f"Video analysis {state['file']}: {state['frames_processed']}/{total} frames, "
+                       f"{state['objects']} objects, {rate:.1f} frames/s")
+        self.log(message)
+
+    def _on_processed(self, fps, job, thumbnails=None):
+        with self.lock:
+            if job["status"] != "done":
+                self.state["frames_failed"] += 1
+            else:
+                result = job["result"]
+                frame = result["frame"]
+                seconds = round(frame / fps, 3) if fps else ""
+                for i, obj in enumerate(result["objects"]):
+                    thumb_name = ""
+                    if thumbnails and thumbnails[i] is not None:
+                        # Sin la etiqueta del clasificador en el nombre (puede
+                        # traer "/" o ".."): ya va en su columna del CSV
+                        thumb_name = f"frame{frame:06d}_obj{i:03d}.jpg"
+                        self.archive.writestr(thumb_name, thumbnails[i])
+                    self.writer.writerow(
+                        [frame, seconds, i, obj["x"], obj["y"], obj["w"], obj["h"]]
+                        + [f"{obj[name]:.6g}" for name in FEATURE_COLUMNS]
+                        + [obj["label"], obj["confidence"], thumb_name]
+                    )
+                self.state["frames_processed"] += 1
+                self.state["objects"] += len(result["objects"])
+                class_count = self.state["class_count"]
+                for label, n in result["class_count"].items():
+                    class_count[label] = class_count.get(label, 0) + n
+        self._maybe_report()
+        self._maybe_finish()
+
+    # Termina cuando la decodificación acabó y todos los frames enviados
+    # tienen resultado
+    def _maybe_finish(self):
+        with self.lock:
+            state = self.state
+            if state["status"] not in ("running", "stopping") or not state["decoded"]:
+                return
+            if state["frames_processed"] + state["frames_failed"] < state["frames_submitted"]:
+                return
+            self.csv_file.close()
+            self.archive.close()
+            self.csv_file = self.writer = self.archive = None
+            state["finished"] = time.time()
+            if state["error"]:
+                state["status"] = "error"
+            elif self.stop_event.is_set():
+                state["status"] = "stopped"
+            else:
+                state["status"] = "done"
+            summary = ", ".join(f"{k}: {v}" for k, v in state["class_count"].items()) or "no objects"
+            message = (f"Video analysis {state['file']} {state['status']}: {state['frames_processed']} frames, "
+                       f"{state['objects']} objects ({summary})")
+            outputs = list(state["outputs"])
+        self.log(message)
+        if self.on_finished is not None:
+            self.on_finished(outputs)
+
+    def status(self):
+        with self.lock:
+            state = dict(self.state)
+            state["class_count"] = dict(state["class_count"])
+        started = state["started"]
+        if started:
+            elapsed = (state["finished"] or time.time()) - started
+            state["elapsed"] = round(elapsed, 1)
+            state["frames_per_second"] = round(state["frames_processed"] / elapsed, 2) if elapsed > 0 else 0.0
+        else:
+            state["elapsed"] = 0.0
+            state["frames_per_second"] = 0.0
+        return state